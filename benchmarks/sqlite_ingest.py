@@ -0,0 +1,72 @@
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import DateTime, Float, String, create_engine
+from sqlalchemy.orm import DeclarativeBase, mapped_column, sessionmaker
+
+from storage_utils.profiles import DefaultProfile, SqliteIngestProfile
+from storage_utils.unit_of_work.db import SqlAlchemyUnitOfWork
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class DataTick(Base):
+
+    __tablename__ = "ticks"
+
+    ticker = mapped_column(String, primary_key=True)
+    t = mapped_column(DateTime(timezone=True), nullable=False, primary_key=True)
+    close = mapped_column(Float, nullable=False)
+    volume = mapped_column(Float, nullable=False)
+
+    @classmethod
+    def from_domain(cls, domain: dict):
+        return cls(**domain)
+
+
+def make_ticks(n_rows: int):
+    start = datetime(2023, 1, 1)
+    return [
+        {"ticker": "SPY", "t": start + timedelta(seconds=i), "close": 10.0, "volume": 20.0}
+        for i in range(n_rows)
+    ]
+
+
+def run(profile, directory: Path, ticks, batch_size: int) -> float:
+    engine = create_engine("sqlite:///{}".format(directory / f"{uuid.uuid4()}.db"))
+    Base.metadata.create_all(engine)
+    engine = profile.apply(engine)
+    uow = SqlAlchemyUnitOfWork(sessionmaker(bind=engine))
+
+    started = time.perf_counter()
+    for i in range(0, len(ticks), batch_size):
+        with uow:
+            uow.repository._push_type(DataTick, ticks[i : i + batch_size])
+            uow.commit()
+    elapsed = time.perf_counter() - started
+
+    engine.dispose()
+    return len(ticks) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite ingest rows/s per engine profile")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    ticks = make_ticks(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in (DefaultProfile, SqliteIngestProfile):
+            rate = run(profile, Path(directory), ticks, args.batch_size)
+            print(f"{profile.__name__:<24} {rate:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
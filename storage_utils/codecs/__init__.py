@@ -0,0 +1,167 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Type
+import gzip
+import struct
+
+
+class Codec(ABC):
+
+    name: str
+
+    @classmethod
+    @abstractmethod
+    def encode(cls, message: Any) -> bytes:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def decode(cls, MessageType: Any, data: bytes) -> Any:
+        pass
+
+
+class JsonCodec(Codec):
+
+    name = "json"
+
+    @classmethod
+    def encode(cls, message: Any) -> bytes:
+        return message.json().encode("utf-8")
+
+    @classmethod
+    def decode(cls, MessageType: Any, data: bytes) -> Any:
+        return MessageType.parse_raw(data.decode("utf-8"))
+
+
+class OrjsonCodec(Codec):
+
+    name = "orjson"
+
+    @classmethod
+    def encode(cls, message: Any) -> bytes:
+        import orjson
+        return orjson.dumps(message.dict(), default=str)
+
+    @classmethod
+    def decode(cls, MessageType: Any, data: bytes) -> Any:
+        import orjson
+        return MessageType.parse_obj(orjson.loads(data))
+
+
+class MsgpackCodec(Codec):
+
+    name = "msgpack"
+
+    @classmethod
+    def encode(cls, message: Any) -> bytes:
+        import msgpack
+        return msgpack.packb(message.dict(), default=str)
+
+    @classmethod
+    def decode(cls, MessageType: Any, data: bytes) -> Any:
+        import msgpack
+        return MessageType.parse_obj(msgpack.unpackb(data))
+
+
+class Compression(ABC):
+
+    name: str
+
+    @classmethod
+    @abstractmethod
+    def compress(cls, data: bytes) -> bytes:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def decompress(cls, data: bytes) -> bytes:
+        pass
+
+
+class GzipCompression(Compression):
+
+    name = "gzip"
+    level: int = 6
+
+    @classmethod
+    def compress(cls, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=cls.level)
+
+    @classmethod
+    def decompress(cls, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZstdCompression(Compression):
+
+    name = "zstd"
+    level: int = 3
+
+    @classmethod
+    def compress(cls, data: bytes) -> bytes:
+        import zstandard
+        return zstandard.ZstdCompressor(level=cls.level).compress(data)
+
+    @classmethod
+    def decompress(cls, data: bytes) -> bytes:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class CompressedCodec(Codec):
+
+    codec: Type[Codec]
+    compression: Type[Compression]
+
+    @classmethod
+    def encode(cls, message: Any) -> bytes:
+        return cls.compression.compress(cls.codec.encode(message))
+
+    @classmethod
+    def decode(cls, MessageType: Any, data: bytes) -> Any:
+        return cls.codec.decode(MessageType, cls.compression.decompress(data))
+
+
+CODECS: Dict[str, Type[Codec]] = {
+    codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)
+}
+COMPRESSIONS: Dict[str, Type[Compression]] = {
+    compression.name: compression for compression in (GzipCompression, ZstdCompression)
+}
+
+
+def compressed(codec: Type[Codec], compression: Type[Compression]) -> Type[Codec]:
+    name = f"{codec.name}+{compression.name}"
+    if name not in CODECS:
+        CODECS[name] = type(
+            f"{codec.__name__}{compression.__name__}",
+            (CompressedCodec,),
+            {"name": name, "codec": codec, "compression": compression},
+        )
+    return CODECS[name]
+
+
+def get_codec(name: str) -> Type[Codec]:
+    if name not in CODECS:
+        codec, _, compression = name.partition("+")
+        if codec not in CODECS or compression not in COMPRESSIONS:
+            raise ValueError(f"unknown codec {name!r}")
+        return compressed(CODECS[codec], COMPRESSIONS[compression])
+    return CODECS[name]
+
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def pack_envelope(payloads: List[bytes]) -> bytes:
+    return b"".join(_FRAME_HEADER.pack(len(payload)) + payload for payload in payloads)
+
+
+def unpack_envelope(data: bytes) -> List[bytes]:
+    payloads = []
+    offset = 0
+    while offset < len(data):
+        (size,) = _FRAME_HEADER.unpack_from(data, offset)
+        offset += _FRAME_HEADER.size
+        payloads.append(data[offset : offset + size])
+        offset += size
+    return payloads
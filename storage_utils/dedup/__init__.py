@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import hashlib
+import time
+
+
+class RecentMessages:
+
+    def __init__(
+        self,
+        max_entries: int = 100000,
+        window_seconds: Optional[float] = None,
+        key: str = "message_id",
+    ) -> None:
+
+        if key not in ("message_id", "payload"):
+            raise ValueError(f"unknown dedup key {key!r}, expected 'message_id' or 'payload'")
+
+        self.max_entries = max_entries
+        self.window_seconds = window_seconds
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self._seen = OrderedDict()
+
+    def message_key(self, message_raw: Any) -> Optional[Hashable]:
+        if self.key == "payload":
+            return hashlib.blake2b(message_raw.data, digest_size=16).digest()
+        return getattr(message_raw, "message_id", None) or None
+
+    def seen(self, subscription: str, message_raw: Any) -> bool:
+        key = self.message_key(message_raw)
+        if key is None:
+            return False
+        key = (subscription, key)
+
+        now = time.monotonic()
+        self._expire(now)
+
+        if key in self._seen:
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            self.hits += 1
+            return True
+
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        self.misses += 1
+        return False
+
+    def _expire(self, now: float):
+        if self.window_seconds is None:
+            return
+        while len(self._seen) > 0:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.window_seconds:
+                break
+            del self._seen[key]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._seen)}
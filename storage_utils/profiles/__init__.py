@@ -0,0 +1,90 @@
+from abc import ABC, abstractmethod
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from weakref import WeakKeyDictionary
+
+
+_applied_profiles = WeakKeyDictionary()
+
+
+class EngineProfile(ABC):
+
+    @classmethod
+    @abstractmethod
+    def apply(cls, engine: Engine) -> Engine:
+        pass
+
+
+class DefaultProfile(EngineProfile):
+
+    @classmethod
+    def apply(cls, engine: Engine) -> Engine:
+        return engine
+
+
+class SqliteIngestProfile(EngineProfile):
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024
+    wal_autocheckpoint: int = 1000
+    begin_immediate: bool = True
+    checkpoint_every_commits: int = 100
+
+    @classmethod
+    def pragmas(cls):
+        return {
+            "journal_mode": cls.journal_mode,
+            "synchronous": cls.synchronous,
+            "mmap_size": cls.mmap_size,
+            "cache_size": cls.cache_size,
+            "wal_autocheckpoint": cls.wal_autocheckpoint,
+        }
+
+    @staticmethod
+    def stats(engine: Engine):
+        return _applied_profiles.get(engine)
+
+    @classmethod
+    def apply(cls, engine: Engine) -> Engine:
+
+        if engine.dialect.name != "sqlite":
+            raise ValueError(f"{cls.__name__} only applies to sqlite engines, got {engine.dialect.name}")
+        if engine in _applied_profiles:
+            return engine
+
+        commits = {"since_checkpoint": 0, "checkpoints": 0}
+        _applied_profiles[engine] = commits
+
+        def _on_connect(dbapi_con, con_record):
+            if cls.begin_immediate:
+                dbapi_con.isolation_level = None
+            cursor = dbapi_con.cursor()
+            for name, value in cls.pragmas().items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        def _on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        def _on_commit(conn):
+            commits["since_checkpoint"] += 1
+
+        def _on_checkin(dbapi_con, con_record):
+            if dbapi_con is None:
+                return
+            if commits["since_checkpoint"] >= cls.checkpoint_every_commits:
+                commits["since_checkpoint"] = 0
+                commits["checkpoints"] += 1
+                dbapi_con.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+        engine.dispose()
+        event.listen(engine, "connect", _on_connect)
+        if cls.begin_immediate:
+            event.listen(engine, "begin", _on_begin)
+        if cls.checkpoint_every_commits > 0:
+            event.listen(engine, "commit", _on_commit)
+            event.listen(engine.pool, "checkin", _on_checkin)
+
+        return engine
@@ -1,4 +1,4 @@
-from typing import Any, Protocol
+from typing import Any, Dict, List, Protocol
 
 
 class Pushable(Protocol):
@@ -16,3 +16,29 @@ class Parsable(Protocol):
     @classmethod
     def parse_raw(cls, raw: str) -> Any:
         pass
+
+
+class BytesParsable(Protocol):
+    @classmethod
+    def parse_bytes(cls, raw: bytes | memoryview) -> Any:
+        pass
+
+
+class BatchParsable(Protocol):
+    @classmethod
+    def parse_many(cls, raws: List[bytes | memoryview]) -> List[Any]:
+        pass
+
+
+class Serializable(Protocol):
+    def json(self) -> str:
+        pass
+
+    def dict(self) -> Dict[str, Any]:
+        pass
+
+
+class ObjParsable(Protocol):
+    @classmethod
+    def parse_obj(cls, obj: Dict[str, Any]) -> Any:
+        pass
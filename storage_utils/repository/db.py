@@ -1,40 +1,170 @@
 from collections import defaultdict
-from typing import Any, Callable, List, Optional, Type, Dict
+from typing import Any, Callable, List, NamedTuple, Optional, Type, Dict
+from datetime import date, datetime
+from decimal import Decimal
+import csv
+import os
 from sqlalchemy.orm import DeclarativeBase, Query, Session
 from sqlalchemy.inspection import inspect
 from sqlalchemy.orm import RelationshipDirection
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
-from sqlalchemy.dialects.postgresql import insert as postgres_insert
-from sqlalchemy.sql import Select
+from sqlalchemy.sql import Select, select
 
 from ..protocols import Pushable
 from .abstract import Repository
 
 
+class ExportStats(NamedTuple):
+    rows: int
+    bytes: int
+
+
 class SqlAlchemyRepository(Repository):
     
     _relationship_topological_order = {}
+    latest_tables: Dict[Type[DeclarativeBase], Type[DeclarativeBase]] = {}
+    latest_order_column: str = "t"
+    export_chunk_size: int = 10000
 
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, snapshot: Optional[Dict[Type, Dict[tuple, Dict]]] = None):
         self.session = session
+        self.snapshot = snapshot
 
     def _pull_scalars_query(self, query: Query | Select, **context) -> List[Any]:
         scalars = self.session.execute(query).scalars()
+        if self.snapshot is not None:
+            scalars = list(scalars)
+            if len(scalars) > 0:
+                self._snapshot_rows(type(scalars[0]), scalars)
         ticks = [scalar.to_domain(**context) for scalar in scalars]
         return ticks
 
+    def _snapshot_rows(self, data_type: Type[DeclarativeBase], data: List[Any]):
+        primary, cols = self._get_primary_and_cols(data_type)
+        snapshot = self.snapshot[data_type]
+        for d in data:
+            row = self._base_to_dict(d, primary + cols)
+            snapshot[tuple(row[c] for c in primary)] = row
+
+    def _advance_snapshot(
+        self, data_type: Type[DeclarativeBase], data: List[Any], columns_subset: List[str]
+    ):
+        primary, cols = self._get_primary_and_cols(data_type)
+        snapshot = self.snapshot[data_type]
+        written_in_full = set(cols) <= set(columns_subset)
+        for d in data:
+            key = tuple(getattr(d, c) for c in primary)
+            if key in snapshot:
+                snapshot[key].update(self._base_to_dict(d, columns_subset))
+            elif written_in_full:
+                snapshot[key] = self._base_to_dict(d, primary + cols)
+
+    def _group_changed(
+        self, data_type: Type[DeclarativeBase], data: List[Any], columns_subset: List[str]
+    ) -> Dict[tuple, List[Any]]:
+        primary, cols = self._get_primary_and_cols(data_type)
+        snapshot = self.snapshot[data_type]
+        groups = defaultdict(list)
+        for d in data:
+            row = self._base_to_dict(d, primary + cols)
+            old = snapshot.get(tuple(row[c] for c in primary))
+            if old is None:
+                groups[tuple(columns_subset)].append(d)
+            else:
+                diff = tuple(c for c in columns_subset if row[c] != old[c])
+                if len(diff) > 0:
+                    groups[diff].append(d)
+        return groups
+
+    def _pull_latest(self, data_type: Type[DeclarativeBase], **context) -> List[Any]:
+        return self._pull_scalars_query(select(self.latest_tables[data_type]), **context)
+
+    def _export_query(self, query: Query | Select, path: str, format: str = "csv") -> ExportStats:
+
+        if format not in ("csv", "parquet"):
+            raise ValueError(f"unknown export format {format!r}")
+
+        if isinstance(query, Query):
+            query = query.statement
+
+        result = self.session.connection().execute(
+            query,
+            execution_options={"stream_results": True, "max_row_buffer": self.export_chunk_size},
+        )
+        try:
+            columns = list(result.keys())
+            chunks = result.partitions(self.export_chunk_size)
+
+            if format == "csv":
+                rows = self._export_csv(columns, chunks, path)
+            else:
+                types = [column.type for column in query.selected_columns]
+                rows = self._export_parquet(columns, types, chunks, path)
+        finally:
+            result.close()
+
+        return ExportStats(rows, os.path.getsize(path))
+
+    @staticmethod
+    def _export_csv(columns: List[str], chunks, path: str) -> int:
+        rows = 0
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for chunk in chunks:
+                writer.writerows(chunk)
+                rows += len(chunk)
+        return rows
+
+    @staticmethod
+    def _export_parquet(columns: List[str], types: List[Any], chunks, path: str) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrow_types = {
+            str: pa.string(),
+            int: pa.int64(),
+            float: pa.float64(),
+            bool: pa.bool_(),
+            bytes: pa.binary(),
+            Decimal: pa.float64(),
+            datetime: pa.timestamp("us"),
+            date: pa.date32(),
+        }
+        fields = []
+        for name, sql_type in zip(columns, types):
+            try:
+                python_type = sql_type.python_type
+            except NotImplementedError:
+                python_type = str
+            fields.append(pa.field(name, arrow_types.get(python_type, pa.string())))
+        schema = pa.schema(fields)
+
+        rows = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(
+                    pa.Table.from_pylist([dict(zip(columns, row)) for row in chunk], schema=schema)
+                )
+                rows += len(chunk)
+        return rows
+
     def _get_dialect(self) -> str:
         return self.session.bind.dialect.name
 
     def _get_insert(self):
         dialect = self._get_dialect()
         if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
             return sqlite_insert
         elif dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as postgres_insert
             return postgres_insert
         else:
             raise AttributeError
 
+    def _get_table(self, data_type: Type[DeclarativeBase]):
+        return data_type
+
     @staticmethod
     def _get_primary_and_cols(base: Type[DeclarativeBase]):
         ref = inspect(base)
@@ -159,12 +289,14 @@ class SqlAlchemyRepository(Repository):
         primary, cols = self._get_primary_and_cols(data_type)
         data = [data_type.from_domain(item, **context) for item in domain_items]
 
-        stmt = insert(data_type).values(
+        stmt = insert(self._get_table(data_type)).values(
             [self._base_to_dict(d, primary + cols) for d in data]
         )
 
         if not push_relationships:
             self.session.execute(stmt)
+            if self.snapshot is not None:
+                self._snapshot_rows(data_type, data)
 
         else :
             statement_buffer = defaultdict(list)
@@ -177,6 +309,8 @@ class SqlAlchemyRepository(Repository):
                 for stmt in statement_buffer[ordered_data_type]:
                     self.session.execute(stmt)
 
+        self._push_latest(data_type, data)
+
     def _push_type_if_not_exist(
         self,
         data_type: Pushable,
@@ -190,17 +324,25 @@ class SqlAlchemyRepository(Repository):
             primary, cols = self._get_primary_and_cols(data_type)
             data = [data_type.from_domain(item, **context) for item in domain_items]
 
-            stmt = insert(data_type).values(
+            stmt = insert(self._get_table(data_type)).values(
                 [self._base_to_dict(d, primary + cols) for d in data]
             )
             stmt = stmt.on_conflict_do_nothing(
                 index_elements=primary,
             )
+            track_latest = data_type in self.latest_tables
+            if track_latest:
+                table = self._get_table(data_type)
+                if table is data_type:
+                    stmt = stmt.returning(*[getattr(data_type, c) for c in primary])
+                else:
+                    stmt = stmt.returning(*[table.c[c] for c in primary])
 
             if not push_relationships:
-                self.session.execute(stmt)
+                result = self.session.execute(stmt)
 
             else :
+                root_stmt = stmt
                 statement_buffer = defaultdict(list)
                 statement_buffer[data_type].append(stmt)
                 self._push_also_relationships(data, data_type, 'on_conflict_do_nothing', statement_buffer)
@@ -209,7 +351,17 @@ class SqlAlchemyRepository(Repository):
 
                 for ordered_data_type in order:
                     for stmt in statement_buffer[ordered_data_type]:
-                        self.session.execute(stmt)
+                        if stmt is root_stmt:
+                            result = self.session.execute(stmt)
+                        else:
+                            self.session.execute(stmt)
+
+            if track_latest:
+                inserted = set(tuple(row) for row in result)
+                self._push_latest(
+                    data_type,
+                    [d for d in data if tuple(getattr(d, c) for c in primary) in inserted],
+                )
 
     def _upsert_type(
         self,
@@ -221,20 +373,20 @@ class SqlAlchemyRepository(Repository):
     ):
 
         if len(domain_items) > 0:
-            insert = self._get_insert()
             primary, cols = self._get_primary_and_cols(data_type)
             if columns_subset is None:
                 columns_subset = cols
 
             data = [data_type.from_domain(item, **context) for item in domain_items]
 
-            stmt = insert(data_type).values(
-                [self._base_to_dict(d, primary + cols) for d in data]
-            )
-            stmt = stmt.on_conflict_do_update(
-                index_elements=primary,
-                set_={name: getattr(stmt.excluded, name) for name in columns_subset},
-            )
+            if self.snapshot is not None and not upsert_relationships:
+                for changed_cols, changed_data in self._group_changed(data_type, data, columns_subset).items():
+                    self.session.execute(self._upsert_statement(data_type, changed_data, list(changed_cols)))
+                    self._advance_snapshot(data_type, changed_data, list(changed_cols))
+                    self._push_latest(data_type, changed_data, list(changed_cols), replace_same_order=True)
+                return
+
+            stmt = self._upsert_statement(data_type, data, columns_subset)
 
             if not upsert_relationships:
                 self.session.execute(stmt)
@@ -249,3 +401,62 @@ class SqlAlchemyRepository(Repository):
                 for ordered_data_type in order:
                     for stmt in statement_buffer[ordered_data_type]:
                         self.session.execute(stmt)
+
+            self._push_latest(data_type, data, columns_subset, replace_same_order=True)
+
+    def _upsert_statement(self, data_type: Pushable, data: List[Any], columns_subset: List[str]):
+
+        insert = self._get_insert()
+        primary, cols = self._get_primary_and_cols(data_type)
+
+        stmt = insert(self._get_table(data_type)).values(
+            [self._base_to_dict(d, primary + cols) for d in data]
+        )
+        if len(columns_subset) > 0:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=primary,
+                set_={name: getattr(stmt.excluded, name) for name in columns_subset},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(
+                index_elements=primary,
+            )
+        return stmt
+
+    def _push_latest(
+        self,
+        data_type: Pushable,
+        data: List[Any],
+        columns_subset: Optional[List[str]] = None,
+        replace_same_order: bool = False,
+    ):
+
+        if data_type not in self.latest_tables or len(data) == 0:
+            return
+
+        latest_type = self.latest_tables[data_type]
+        group, cols = self._get_primary_and_cols(latest_type)
+        order = self.latest_order_column
+
+        latest = {}
+        for d in data:
+            key = tuple(getattr(d, c) for c in group)
+            if key not in latest or getattr(latest[key], order) < getattr(d, order):
+                latest[key] = d
+
+        insert = self._get_insert()
+        stmt = insert(latest_type).values(
+            [self._base_to_dict(d, group + cols) for d in latest.values()]
+        )
+        if columns_subset is not None:
+            cols = [c for c in cols if c in columns_subset or c == order]
+        if replace_same_order:
+            advances = getattr(latest_type, order) <= getattr(stmt.excluded, order)
+        else:
+            advances = getattr(latest_type, order) < getattr(stmt.excluded, order)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=group,
+            set_={name: getattr(stmt.excluded, name) for name in cols},
+            where=advances,
+        )
+        self.session.execute(stmt)
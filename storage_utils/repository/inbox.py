@@ -0,0 +1,9 @@
+from sqlalchemy import DateTime, String
+from sqlalchemy.orm import mapped_column
+
+
+class InboxMessageMixin:
+
+    subscription = mapped_column(String, primary_key=True)
+    message_id = mapped_column(String, primary_key=True)
+    processed_at = mapped_column(DateTime(timezone=True), nullable=False)
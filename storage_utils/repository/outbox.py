@@ -0,0 +1,37 @@
+from typing import Any, Dict, List, Optional, Tuple, Type
+from sqlalchemy import JSON, DateTime, Integer, LargeBinary, String
+from sqlalchemy.orm import Session, mapped_column
+
+from ..protocols import Pushable
+from .db import SqlAlchemyRepository
+
+
+class OutboxMessageMixin:
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    topic = mapped_column(String, nullable=False)
+    data = mapped_column(LargeBinary, nullable=False)
+    ordering_key = mapped_column(String, nullable=False, default="")
+    attributes = mapped_column(JSON, nullable=False, default=dict)
+    created_at = mapped_column(DateTime(timezone=True), nullable=False)
+    sent_at = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class OutboxRepository(SqlAlchemyRepository):
+
+    def __init__(
+        self,
+        session: Session,
+        snapshot: Optional[Dict[Type, Dict[tuple, Dict]]] = None,
+        outbox_buffer: Optional[List[Tuple[str, Any]]] = None,
+    ):
+        super().__init__(session, snapshot)
+        self.outbox_buffer = outbox_buffer if outbox_buffer is not None else []
+
+    def _push_to_topic(
+        self, topic: str, MessageType: Pushable, items: List[Any], **context
+    ):
+
+        self.outbox_buffer.extend(
+            (topic, MessageType.from_domain(item, **context)) for item in items
+        )
@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Type
+from weakref import WeakKeyDictionary
+from sqlalchemy import MetaData, Table, event
+from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.sql import select
+
+from ..protocols import Pushable
+from .db import SqlAlchemyRepository
+
+
+class Partitioning(ABC):
+
+    attribute: str
+
+    @classmethod
+    @abstractmethod
+    def key(cls, item: Any) -> str:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def keys_between(cls, start: Any, end: Any) -> List[str]:
+        pass
+
+
+class DailyPartitioning(Partitioning):
+
+    attribute: str = "t"
+
+    @classmethod
+    def key(cls, item: Any) -> str:
+        return getattr(item, cls.attribute).strftime("%Y%m%d")
+
+    @classmethod
+    def keys_between(cls, start: datetime, end: datetime) -> List[str]:
+        keys = []
+        day = start.date()
+        while day <= end.date():
+            keys.append(day.strftime("%Y%m%d"))
+            day += timedelta(days=1)
+        return keys
+
+
+class MonthlyPartitioning(Partitioning):
+
+    attribute: str = "t"
+
+    @classmethod
+    def key(cls, item: Any) -> str:
+        return getattr(item, cls.attribute).strftime("%Y%m")
+
+    @classmethod
+    def keys_between(cls, start: datetime, end: datetime) -> List[str]:
+        keys = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            keys.append(f"{year:04d}{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return keys
+
+
+class PartitionCache:
+
+    def __init__(self) -> None:
+        self.metadata = MetaData()
+        self.tables: Dict[str, Table] = {}
+        self.created = set()
+
+
+class PartitionedSqlAlchemyRepository(SqlAlchemyRepository):
+
+    partitioning: Dict[Type[DeclarativeBase], Type[Partitioning]] = {}
+    create_partitions: bool = False
+
+    _partitions_per_engine = WeakKeyDictionary()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._routing = {}
+        self._created = set()
+
+        engine = self.session.get_bind()
+        if engine not in self._partitions_per_engine:
+            self._partitions_per_engine[engine] = PartitionCache()
+        self._partitions = self._partitions_per_engine[engine]
+
+    def _get_table(self, data_type: Type[DeclarativeBase]):
+        return self._routing.get(data_type, data_type)
+
+    def _get_partition_table(self, data_type: Type[DeclarativeBase], key: str, create: bool = False) -> Table:
+
+        partitions = self._partitions
+        name = f"{data_type.__tablename__}_{key}"
+        if name not in partitions.tables:
+            partitions.tables[name] = data_type.__table__.to_metadata(
+                partitions.metadata, name=name
+            )
+        table = partitions.tables[name]
+
+        if create and name not in partitions.created and name not in self._created:
+            table.create(self.session.connection(), checkfirst=True)
+            if len(self._created) == 0:
+                event.listen(self.session, "after_commit", self._remember_created, once=True)
+            self._created.add(name)
+        return table
+
+    def _remember_created(self, session):
+        self._partitions.created.update(self._created)
+        self._created.clear()
+
+    def _group_by_partition(self, data_type: Type[DeclarativeBase], domain_items: List[Any]):
+        partitioning = self.partitioning[data_type]
+        groups = defaultdict(list)
+        for item in domain_items:
+            groups[partitioning.key(item)].append(item)
+        return groups
+
+    def _push_partitioned(self, push: Callable, data_type: Pushable, domain_items: List[Any], *args, **kwargs):
+
+        if data_type not in self.partitioning:
+            return push(data_type, domain_items, *args, **kwargs)
+
+        for key, items in self._group_by_partition(data_type, domain_items).items():
+            self._routing[data_type] = self._get_partition_table(data_type, key, self.create_partitions)
+            try:
+                push(data_type, items, *args, **kwargs)
+            finally:
+                del self._routing[data_type]
+
+    def _push_type(self, data_type: Pushable, domain_items: List[Any], *args, **kwargs):
+        self._push_partitioned(super()._push_type, data_type, domain_items, *args, **kwargs)
+
+    def _push_type_if_not_exist(self, data_type: Pushable, domain_items: List[Any], *args, **kwargs):
+        self._push_partitioned(super()._push_type_if_not_exist, data_type, domain_items, *args, **kwargs)
+
+    def _upsert_type(self, data_type: Pushable, domain_items: List[Any], *args, **kwargs):
+        self._push_partitioned(super()._upsert_type, data_type, domain_items, *args, **kwargs)
+
+    def _pull_partitions(
+        self,
+        data_type: Type[DeclarativeBase],
+        start: Any,
+        end: Any,
+        where: Optional[Callable[[Table], Any]] = None,
+        **context
+    ) -> List[Any]:
+
+        partitioning = self.partitioning[data_type]
+        primary, cols = self._get_primary_and_cols(data_type)
+        inspector = inspect(self.session.connection())
+
+        output = []
+        for key in partitioning.keys_between(start, end):
+            table = self._get_partition_table(data_type, key)
+            if not inspector.has_table(table.name):
+                continue
+
+            column = table.c[partitioning.attribute]
+            query = select(table).where(column >= start, column < end).order_by(column)
+            if where is not None:
+                query = query.where(where(table))
+
+            rows = [data_type(**row._mapping) for row in self.session.execute(query)]
+            if self.snapshot is not None and len(rows) > 0:
+                self._snapshot_rows(data_type, rows)
+            output.extend(row.to_domain(**context) for row in rows)
+
+        return output
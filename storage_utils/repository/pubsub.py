@@ -1,16 +1,28 @@
-from typing import List, Dict, Type, Any
+from collections import defaultdict
+from typing import Callable, List, Dict, NamedTuple, Type, Any, Optional
+import asyncio
 import json
+import time
 
 from .abstract import Repository
+from ..codecs import Codec, JsonCodec, get_codec, unpack_envelope
+from ..dedup import RecentMessages
 from ..protocols import Parsable, Pushable
 from ..retrying import NoRetry, RetryingConfig
 
 
+class DeadLetter(NamedTuple):
+    data: bytes
+    attributes: Dict[str, str]
+
+
 class PubSubRepository(Repository):
 
     retrying_config: Type[RetryingConfig] = NoRetry
     timeout: int = 120
     max_pull_messages: int = 1000
+    parallel_pulls_per_subscription: int = 1
+    max_dead_letter_error_length: int = 1024
 
     def __init__(
         self,
@@ -18,12 +30,29 @@ class PubSubRepository(Repository):
         config: object,
         pubsub_ack_buffer: Dict[str, Dict[int, str]],
         pubsub_publisher_buffer: Dict[str, List[Pushable]],
+        dedup: Optional[RecentMessages] = None,
+        attribute_filters: Optional[Dict[str, Callable[[Dict[str, str]], bool]]] = None,
+        filtered_policy: str = "ack",
+        dead_letter_topics: Optional[Dict[str, str]] = None,
+        pubsub_dead_letter_buffer: Optional[Dict[str, List[DeadLetter]]] = None,
+        on_push: Optional[Callable[[str, List[Any]], None]] = None,
     ) -> None:
 
+        if filtered_policy not in ("ack", "nack"):
+            raise ValueError(f"unknown filtered_policy {filtered_policy!r}, expected 'ack' or 'nack'")
+
         self.pubsub_subscriber_client = pubsub_subscriber_client
         self.config = config
         self.pubsub_ack_buffer = pubsub_ack_buffer
         self.pubsub_publisher_buffer = pubsub_publisher_buffer
+        self.dedup = dedup
+        self.attribute_filters = attribute_filters or {}
+        self.filtered_policy = filtered_policy
+        self.dead_letter_topics = dead_letter_topics or {}
+        self.pubsub_dead_letter_buffer = pubsub_dead_letter_buffer
+        if self.pubsub_dead_letter_buffer is None:
+            self.pubsub_dead_letter_buffer = defaultdict(list)
+        self.on_push = on_push
 
     async def _pull_from_subscription(
         self, subscription: str, MessageType: Parsable, **context
@@ -32,26 +61,224 @@ class PubSubRepository(Repository):
         messages = await self._retriable_pull_call(
             subscription
         )
-        output = []
+        messages = await self._screen(subscription, messages)
+        return self._messages_to_domain(subscription, MessageType, messages, **context)
+
+    async def _pull_from_subscriptions(
+        self,
+        subscriptions: Dict[str, Parsable],
+        max_messages: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        **context
+    ) -> Dict[str, List[Any]]:
+
+        output = {subscription: [] for subscription in subscriptions}
+        active = list(subscriptions)
+        pulled_messages = 0
+        pulled_bytes = 0
+        started = time.monotonic()
+
+        while len(active) > 0:
+
+            calls = [
+                subscription
+                for subscription in active
+                for _ in range(self.parallel_pulls_per_subscription)
+            ]
+            pull_size = self.max_pull_messages
+            if max_messages is not None:
+                remaining = max_messages - pulled_messages
+                calls = calls[:remaining]
+                pull_size = min(pull_size, -(-remaining // len(calls)))
+
+            timeout = None
+            if max_seconds is not None:
+                timeout = max(max_seconds - (time.monotonic() - started), 0)
+
+            tasks = {
+                asyncio.ensure_future(self._retriable_pull_call(subscription, pull_size)): subscription
+                for subscription in calls
+            }
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+            pulled = defaultdict(list)
+            errors = []
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                else:
+                    pulled[tasks[task]].extend(task.result())
+
+            for subscription, messages in pulled.items():
+                pulled_messages += len(messages)
+                pulled_bytes += sum(len(message.data) for message in messages)
+                messages = await self._screen(subscription, messages)
+                output[subscription].extend(
+                    self._messages_to_domain(subscription, subscriptions[subscription], messages, **context)
+                )
+
+            if len(errors) > 0:
+                raise errors[0]
+
+            active = [subscription for subscription in active if len(pulled[subscription]) > 0]
+
+            if max_messages is None and max_bytes is None and max_seconds is None:
+                break
+            if max_messages is not None and pulled_messages >= max_messages:
+                break
+            if max_bytes is not None and pulled_bytes >= max_bytes:
+                break
+            if max_seconds is not None and time.monotonic() - started >= max_seconds:
+                break
+
+        return output
+
+    async def _screen(self, subscription: str, messages: List[Any]) -> List[Any]:
+
+        accept = self.attribute_filters.get(subscription)
+        if (accept is None and self.dedup is None) or len(messages) == 0:
+            return messages
+
+        fresh = []
+        rejected = []
+        duplicates = []
+        for message_raw in messages:
+            if accept is not None and not accept(getattr(message_raw, "attributes", None) or {}):
+                rejected.append(message_raw.ack_id)
+            elif self.dedup is not None and self.dedup.seen(subscription, message_raw):
+                duplicates.append(message_raw.ack_id)
+            else:
+                fresh.append(message_raw)
+
+        if self.filtered_policy == "ack":
+            duplicates.extend(rejected)
+        elif len(rejected) > 0:
+            await self._retriable_modify_ack_deadline_call(subscription, rejected, 0)
+        if len(duplicates) > 0:
+            await self._retriable_acknowledge_call(subscription, duplicates)
+        return fresh
+
+    def _messages_to_domain(
+        self, subscription: str, MessageType: Parsable, messages: List[Any], **context
+    ) -> List[Any]:
+
+        isolate = subscription in self.dead_letter_topics
+        ack_ids = []
+        codecs = []
+        payloads = []
+        sources = []
         for message_raw in messages:
+            try:
+                codec = self._get_codec(message_raw)
+                if self._is_envelope(message_raw):
+                    items = unpack_envelope(message_raw.data)
+                else:
+                    items = [message_raw.data]
+            except Exception as error:
+                if not isolate:
+                    raise
+                self._dead_letter(subscription, message_raw, message_raw.data, error)
+                continue
+            ack_ids.extend([message_raw.ack_id] * len(items))
+            codecs.extend([codec] * len(items))
+            payloads.extend(items)
+            sources.extend([message_raw] * len(items))
 
-            message = MessageType.parse_raw(message_raw.data.decode("utf-8"))
-            domain_message = message.to_domain(**context)
-            self.pubsub_ack_buffer[subscription][id(domain_message)]= message_raw.ack_id
+        parsed = self._parse_payloads(MessageType, codecs, payloads, isolate)
+
+        output = []
+        for ack_id, message_raw, payload, message in zip(ack_ids, sources, payloads, parsed):
+
+            try:
+                if isinstance(message, Exception):
+                    raise message
+                domain_message = message.to_domain(**context)
+            except Exception as error:
+                if not isolate:
+                    raise
+                self._dead_letter(subscription, message_raw, payload, error)
+                continue
+            self.pubsub_ack_buffer[subscription][id(domain_message)]= ack_id
             output.append(domain_message)
 
         return output
 
+    def _parse_payloads(
+        self, MessageType: Parsable, codecs: List[Type[Codec]], payloads: List[bytes], isolate: bool = False
+    ) -> List[Any]:
+
+        raw = [i for i, codec in enumerate(codecs) if codec is JsonCodec]
+
+        parsed = [None] * len(payloads)
+        try:
+            if len(raw) > 0 and hasattr(MessageType, "parse_many"):
+                for i, message in zip(raw, MessageType.parse_many([payloads[i] for i in raw])):
+                    parsed[i] = message
+        except Exception:
+            if not isolate:
+                raise
+            parsed = [None] * len(payloads)
+
+        for i, (codec, payload) in enumerate(zip(codecs, payloads)):
+            if parsed[i] is not None:
+                continue
+            try:
+                if codec is JsonCodec and hasattr(MessageType, "parse_bytes"):
+                    parsed[i] = MessageType.parse_bytes(payload)
+                else:
+                    parsed[i] = codec.decode(MessageType, payload)
+            except Exception as error:
+                if not isolate:
+                    raise
+                parsed[i] = error
+        return parsed
+
+    def _dead_letter(self, subscription: str, message_raw: Any, data: bytes, error: Exception):
+
+        attributes = dict(getattr(message_raw, "attributes", None) or {})
+        attributes.pop("envelope", None)
+        attributes["dead_letter_subscription"] = subscription
+        attributes["dead_letter_error"] = f"{type(error).__name__}: {error}"[: self.max_dead_letter_error_length]
+
+        dead_letter = DeadLetter(data, attributes)
+        self.pubsub_ack_buffer[subscription][id(dead_letter)] = message_raw.ack_id
+        self.pubsub_dead_letter_buffer[subscription].append(dead_letter)
+
+    @staticmethod
+    def _is_envelope(message_raw: Any) -> bool:
+        attributes = getattr(message_raw, "attributes", None) or {}
+        return attributes.get("envelope") == "1"
+
+    @staticmethod
+    def _get_codec(message_raw: Any) -> Type[Codec]:
+        attributes = getattr(message_raw, "attributes", None) or {}
+        return get_codec(attributes.get("codec", JsonCodec.name))
+
     def _push_to_topic(
         self, topic: str, MessageType: Pushable, items: List[Any], **context
     ):
 
-        buffer = self.pubsub_publisher_buffer[topic]
-        for item in items:
-            buffer.append(MessageType.from_domain(item, **context))
+        messages = [MessageType.from_domain(item, **context) for item in items]
+        self.pubsub_publisher_buffer[topic].extend(messages)
+        if self.on_push is not None:
+            self.on_push(topic, messages)
 
-    async def _retriable_pull_call(self, subscription: str):
+    async def _retriable_pull_call(self, subscription: str, max_messages: Optional[int] = None):
+        if max_messages is None:
+            max_messages = self.max_pull_messages
         return await self.retrying_config.to_decorator()(self.pubsub_subscriber_client.pull)(
-                subscription, max_messages=self.max_pull_messages, timeout=self.timeout
+                subscription, max_messages=max_messages, timeout=self.timeout
             )
 
+    async def _retriable_acknowledge_call(self, subscription: str, ack_ids: List[str]):
+        return await self.retrying_config.to_decorator()(self.pubsub_subscriber_client.acknowledge)(
+                subscription, ack_ids, timeout=self.timeout
+            )
+
+    async def _retriable_modify_ack_deadline_call(self, subscription: str, ack_ids: List[str], ack_deadline_seconds: int):
+        return await self.retrying_config.to_decorator()(self.pubsub_subscriber_client.modify_ack_deadline)(
+                subscription, ack_ids, ack_deadline_seconds, timeout=self.timeout
+            )
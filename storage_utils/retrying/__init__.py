@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
-import aiohttp
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
-from typing import Callable, Tuple, Type
+from typing import Callable, Optional, Tuple, Type
+
+
+def network_errors() -> Tuple[Type[Exception], ...]:
+    import aiohttp
+    return (aiohttp.ClientResponseError, aiohttp.ClientOSError)
 
 
 class RetryingConfig(ABC):
@@ -13,14 +17,15 @@ class RetryingConfig(ABC):
 
 class RetryNetworkErrors(RetryingConfig):
 
-    exceptions: Tuple[Type[Exception], ...] = (aiohttp.ClientResponseError,aiohttp.ClientOSError)
+    exceptions: Optional[Tuple[Type[Exception], ...]] = None
     exponential_rate: int = 1
     exponential_max: int = 10
     stop_after_attempt: int = 5
 
     @classmethod
     def to_decorator(cls) -> Callable: 
-        retry_if = retry_if_exception_type(cls.exceptions)
+        exceptions = cls.exceptions if cls.exceptions is not None else network_errors()
+        retry_if = retry_if_exception_type(exceptions)
         return retry(
                 wait=wait_exponential(multiplier=cls.exponential_rate, max=cls.exponential_max),
                 retry=retry_if,
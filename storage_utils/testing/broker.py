@@ -0,0 +1,303 @@
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Type
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+def network_fault() -> Exception:
+    import aiohttp
+    return aiohttp.ClientOSError("injected fault")
+
+
+class BrokerMessage:
+
+    __slots__ = (
+        "ack_id",
+        "message_id",
+        "publish_time",
+        "data",
+        "attributes",
+        "ordering_key",
+        "delivery_attempt",
+        "sequence",
+    )
+
+    def __init__(self, message_id: str, data: bytes, attributes: Dict[str, str], ordering_key: str, sequence: int) -> None:
+        self.ack_id = None
+        self.message_id = message_id
+        self.publish_time = datetime.now(timezone.utc)
+        self.data = data
+        self.attributes = attributes
+        self.ordering_key = ordering_key
+        self.delivery_attempt = 0
+        self.sequence = sequence
+
+    def delivered(self, ack_id: str) -> "BrokerMessage":
+        copy = BrokerMessage(self.message_id, self.data, self.attributes, self.ordering_key, self.sequence)
+        copy.publish_time = self.publish_time
+        copy.delivery_attempt = self.delivery_attempt
+        copy.ack_id = ack_id
+        return copy
+
+
+class Lease:
+
+    __slots__ = ("subscription", "message", "deadline")
+
+    def __init__(self, subscription: str, message: BrokerMessage, deadline: float) -> None:
+        self.subscription = subscription
+        self.message = message
+        self.deadline = deadline
+
+
+class SubscriptionQueue:
+
+    def __init__(self) -> None:
+        self.unordered: Deque[BrokerMessage] = deque()
+        self.keyed: Dict[str, Deque[BrokerMessage]] = defaultdict(deque)
+        self.ready: Deque[str] = deque()
+        self.in_ready = set()
+        self.leased_keys: Dict[str, set] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.unordered) + sum(len(x) for x in self.keyed.values())
+
+    def enqueue(self, message: BrokerMessage):
+        if message.ordering_key == "":
+            self.unordered.append(message)
+        else:
+            self.keyed[message.ordering_key].append(message)
+            self._mark_ready(message.ordering_key)
+
+    def requeue(self, messages: List[BrokerMessage]):
+        unordered = [m for m in messages if m.ordering_key == ""]
+        self.unordered.extendleft(reversed(unordered))
+        by_key = defaultdict(list)
+        for message in messages:
+            if message.ordering_key != "":
+                by_key[message.ordering_key].append(message)
+        for key, keyed in by_key.items():
+            keyed.sort(key=lambda m: m.sequence)
+            self.keyed[key].extendleft(reversed(keyed))
+            self._mark_ready(key)
+
+    def _mark_ready(self, key: str):
+        if key not in self.in_ready and len(self.leased_keys.get(key, ())) == 0:
+            self.ready.append(key)
+            self.in_ready.add(key)
+
+    def release_key(self, key: str):
+        if len(self.leased_keys.get(key, ())) == 0:
+            self.leased_keys.pop(key, None)
+            if len(self.keyed.get(key, ())) > 0:
+                self._mark_ready(key)
+
+    def take(self, max_messages: int) -> List[BrokerMessage]:
+
+        taken = []
+        while len(taken) < max_messages and len(self.ready) > 0:
+            key = self.ready.popleft()
+            self.in_ready.discard(key)
+            pending = self.keyed[key]
+            while len(taken) < max_messages and len(pending) > 0:
+                taken.append(pending.popleft())
+            if len(pending) == 0:
+                del self.keyed[key]
+
+        while len(taken) < max_messages and len(self.unordered) > 0:
+            taken.append(self.unordered.popleft())
+        return taken
+
+
+class InMemoryBroker:
+
+    ack_deadline_seconds: float = 10
+    auto_subscribe: bool = True
+    latency_seconds: float = 0
+    fault_rates: Dict[str, float] = {}
+    fault_exception: Optional[Type[Exception]] = None
+    seed: Optional[int] = None
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+
+        self.clock = clock
+        self.subscriptions: Dict[str, List[str]] = defaultdict(list)
+        self.queues: Dict[str, SubscriptionQueue] = {}
+        self.leases: Dict[str, Lease] = {}
+        self._expiry = []
+        self._ids = itertools.count()
+        self._random = random.Random(self.seed)
+        self.stats = defaultdict(int)
+
+    def subscribe(self, topic: str, subscription: str):
+        if subscription not in self.queues:
+            self.queues[subscription] = SubscriptionQueue()
+            self.subscriptions[topic].append(subscription)
+
+    def backlog(self, subscription: str) -> int:
+        self._expire()
+        return len(self.queues[subscription]) if subscription in self.queues else 0
+
+    def outstanding(self, subscription: str) -> int:
+        return sum(1 for lease in self.leases.values() if lease.subscription == subscription)
+
+    async def _call(self, operation: str):
+        self.stats[operation + "_calls"] += 1
+        if self.latency_seconds > 0:
+            await asyncio.sleep(self.latency_seconds)
+        rate = self.fault_rates.get(operation, 0)
+        if rate > 0 and self._random.random() < rate:
+            self.stats[operation + "_faults"] += 1
+            if self.fault_exception is not None:
+                raise self.fault_exception("injected fault")
+            raise network_fault()
+
+    async def publish(self, topic: str, messages: List[Any]) -> Dict[str, List[str]]:
+
+        await self._call("publish")
+        if self.auto_subscribe and topic not in self.subscriptions:
+            self.subscribe(topic, topic)
+
+        message_ids = []
+        for message in messages:
+            sequence = next(self._ids)
+            message_id = str(sequence)
+            data = message.data.encode("utf-8") if isinstance(message.data, str) else message.data
+            for subscription in self.subscriptions[topic]:
+                self.queues[subscription].enqueue(
+                    BrokerMessage(message_id, data, dict(message.attributes), message.ordering_key, sequence)
+                )
+            message_ids.append(message_id)
+
+        self.stats["published"] += len(messages)
+        return {"messageIds": message_ids}
+
+    async def pull(self, subscription: str, max_messages: int) -> List[BrokerMessage]:
+
+        await self._call("pull")
+        if subscription not in self.queues:
+            if not self.auto_subscribe:
+                raise KeyError(subscription)
+            self.subscribe(subscription, subscription)
+        self._expire()
+
+        queue = self.queues[subscription]
+        deadline = self.clock() + self.ack_deadline_seconds
+        delivered = []
+        for message in queue.take(max_messages):
+            message.delivery_attempt += 1
+            ack_id = f"{subscription}:{message.message_id}:{next(self._ids)}"
+            self.leases[ack_id] = Lease(subscription, message, deadline)
+            heapq.heappush(self._expiry, (deadline, ack_id))
+            if message.ordering_key != "":
+                queue.leased_keys[message.ordering_key].add(ack_id)
+            delivered.append(message.delivered(ack_id))
+
+        self.stats["delivered"] += len(delivered)
+        self.stats["redelivered"] += sum(1 for m in delivered if m.delivery_attempt > 1)
+        return delivered
+
+    async def acknowledge(self, subscription: str, ack_ids: List[str]):
+
+        await self._call("acknowledge")
+        for ack_id in ack_ids:
+            lease = self.leases.pop(ack_id, None)
+            if lease is None:
+                continue
+            self.stats["acked"] += 1
+            self._unlease(ack_id, lease)
+
+    async def modify_ack_deadline(self, subscription: str, ack_ids: List[str], ack_deadline_seconds: float):
+
+        await self._call("modify_ack_deadline")
+        if ack_deadline_seconds == 0:
+            self._redeliver(ack_ids)
+            return
+
+        deadline = self.clock() + ack_deadline_seconds
+        for ack_id in ack_ids:
+            lease = self.leases.get(ack_id)
+            if lease is not None:
+                lease.deadline = deadline
+                heapq.heappush(self._expiry, (deadline, ack_id))
+
+    def _unlease(self, ack_id: str, lease: Lease):
+        key = lease.message.ordering_key
+        if key != "":
+            queue = self.queues[lease.subscription]
+            queue.leased_keys[key].discard(ack_id)
+            queue.release_key(key)
+
+    def _redeliver(self, ack_ids: List[str]):
+
+        released = defaultdict(list)
+        pending = list(ack_ids)
+        while len(pending) > 0:
+            ack_id = pending.pop()
+            lease = self.leases.pop(ack_id, None)
+            if lease is None:
+                continue
+            key = lease.message.ordering_key
+            if key != "":
+                siblings = self.queues[lease.subscription].leased_keys[key]
+                siblings.discard(ack_id)
+                pending.extend(siblings)
+            released[lease.subscription].append((ack_id, lease))
+
+        for subscription, leases in released.items():
+            queue = self.queues[subscription]
+            queue.requeue([lease.message for _, lease in leases])
+            for ack_id, lease in leases:
+                self._unlease(ack_id, lease)
+
+    def _expire(self):
+        now = self.clock()
+        expired = []
+        while len(self._expiry) > 0 and self._expiry[0][0] <= now:
+            deadline, ack_id = heapq.heappop(self._expiry)
+            lease = self.leases.get(ack_id)
+            if lease is not None and lease.deadline <= now:
+                expired.append(ack_id)
+        if len(expired) > 0:
+            self.stats["expired"] += len(expired)
+            self._redeliver(expired)
+
+    def subscriber_client(self, session=None) -> "InMemorySubscriberClient":
+        return InMemorySubscriberClient(self)
+
+    def publisher_client(self, session=None) -> "InMemoryPublisherClient":
+        return InMemoryPublisherClient(self)
+
+
+class InMemorySubscriberClient:
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.broker = broker
+
+    async def pull(self, subscription, max_messages=100, timeout=10):
+        return await self.broker.pull(subscription, max_messages)
+
+    async def acknowledge(self, subscription, ack_ids, timeout=10):
+        await self.broker.acknowledge(subscription, ack_ids)
+
+    async def modify_ack_deadline(self, subscription, ack_ids, ack_deadline_seconds, timeout=10):
+        await self.broker.modify_ack_deadline(subscription, ack_ids, ack_deadline_seconds)
+
+    async def close(self):
+        pass
+
+
+class InMemoryPublisherClient:
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.broker = broker
+
+    async def publish(self, topic, messages, timeout=10):
+        return await self.broker.publish(topic, messages)
+
+    async def close(self):
+        pass
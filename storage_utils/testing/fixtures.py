@@ -10,6 +10,9 @@ import uuid
 
 import pytest
 
+from storage_utils.repository.inbox import InboxMessageMixin
+from storage_utils.repository.outbox import OutboxMessageMixin
+
 
 class DomainTick:
 
@@ -72,6 +75,35 @@ class DataTick(Base):
         return new
 
 
+class LatestTick(Base):
+
+    __tablename__ = "latest_ticks"
+
+    ticker = mapped_column(String, primary_key=True)
+    t = mapped_column(DateTime(timezone=True), nullable=False)
+    close = mapped_column(Float, nullable=False)
+    volume = mapped_column(Float, nullable=False)
+
+    def to_domain(self):
+
+        dt = DomainTick()
+        dt.ticker = self.ticker
+        dt.t = self.t
+        dt.close = self.close
+        dt.volume = self.volume
+        return dt
+
+
+class OutboxMessage(OutboxMessageMixin, Base):
+
+    __tablename__ = "outbox"
+
+
+class InboxMessage(InboxMessageMixin, Base):
+
+    __tablename__ = "inbox"
+
+
 class MessageTick:
 
     ticker: str
@@ -99,6 +131,15 @@ class MessageTick:
     def json(self):
         return json.dumps({**self.__dict__, "t": self.t.strftime("%Y-%m-%d %H:%M:%S")})
 
+    def dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def parse_obj(cls, obj):
+        if isinstance(obj["t"], str):
+            obj = {**obj, "t": datetime.fromisoformat(obj["t"])}
+        return cls.from_dict(obj)
+
     @classmethod
     def parse_raw(cls, raw: str):
         as_dict = json.loads(raw)
@@ -246,6 +287,7 @@ def fake_messages(fake_data):
     class FakeMessage:
         def __init__(self, ack_id: str, data: bytes) -> None:
             self.ack_id = ack_id
+            self.message_id = ack_id
             self.data = data
 
     messages = []
@@ -269,23 +311,23 @@ def fake_pubsub_subscriber_client(fake_pubsub_subscriber_buffer, fake_pubsub_sub
     class FakePubSubSubcriberClient:
         def __init__(self, *args, **kwargs) -> None:
             self.acknowledged = fake_pubsub_subscriber_ack_buffer
+            self.modified_ack_deadlines = defaultdict(list)
 
         async def pull(self, subscription, max_messages=20, timeout=10):
-            messages = fake_pubsub_subscriber_buffer[subscription]
-            to_return = []
-            while len(messages) > 0 and len(to_return) < max_messages:
-                message = messages[0]
-                messages = messages[1:]
-                to_return.append(message)
-            return to_return
+            return fake_pubsub_subscriber_buffer[subscription][:max_messages]
 
         async def acknowledge(self, subscription, ack_ids, timeout=10):
 
             for ack_id in ack_ids:
                 self.acknowledged[subscription].append(ack_id)
 
+            acked = set(ack_ids)
             messages = fake_pubsub_subscriber_buffer[subscription]
-            fake_pubsub_subscriber_buffer[subscription] = [x for x in messages if x.ack_id not in ack_ids]
+            fake_pubsub_subscriber_buffer[subscription] = [x for x in messages if x.ack_id not in acked]
+
+        async def modify_ack_deadline(self, subscription, ack_ids, ack_deadline_seconds, timeout=10):
+            for ack_id in ack_ids:
+                self.modified_ack_deadlines[subscription].append((ack_id, ack_deadline_seconds))
 
         async def close(self):
             pass
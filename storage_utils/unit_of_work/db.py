@@ -1,3 +1,4 @@
+from collections import defaultdict
 from typing import Callable
 from .abstract import UnitOfWork
 from ..repository.db import SqlAlchemyRepository
@@ -5,6 +6,7 @@ from ..repository.db import SqlAlchemyRepository
 
 class SqlAlchemyUnitOfWork(UnitOfWork):
 
+    track_changes: bool = False
     repository: SqlAlchemyRepository
 
     def __init__(self, session_factory: Callable) -> None:
@@ -13,10 +15,13 @@ class SqlAlchemyUnitOfWork(UnitOfWork):
         super().__init__()
 
     def create_repository(self) -> SqlAlchemyRepository:
-        return SqlAlchemyRepository(self.session_factory())
+        self.snapshot = defaultdict(dict) if self.track_changes else None
+        return SqlAlchemyRepository(self.session_factory(), self.snapshot)
 
     def commit(self):
         self.repository.session.commit()
 
     def rollback(self):
         self.repository.session.rollback()
+        if self.snapshot is not None:
+            self.snapshot.clear()
@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Optional, Set, Type
+import asyncio
+import logging
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from .db import SqlAlchemyUnitOfWork
+from .pubsub import PubSubUnitOfWork
+from ..protocols import Parsable
+from ..repository.db import SqlAlchemyRepository
+
+logger = logging.getLogger(__name__)
+
+
+class InboxPipeline:
+
+    pull_size: int = 1000
+    empty_pull_sleep_seconds: float = 0.5
+
+    def __init__(
+        self,
+        pubsub_unit_of_work: PubSubUnitOfWork,
+        db_unit_of_work: SqlAlchemyUnitOfWork,
+        inbox_model: Type[DeclarativeBase],
+        subscription: str,
+        MessageType: Parsable,
+        handler: Callable[[SqlAlchemyRepository, List[Any]], None],
+        **context,
+    ) -> None:
+
+        self.pubsub_unit_of_work = pubsub_unit_of_work
+        self.db_unit_of_work = db_unit_of_work
+        self.inbox_model = inbox_model
+        self.subscription = subscription
+        self.MessageType = MessageType
+        self.handler = handler
+        self.context = context
+        self.batches = 0
+        self.processed = 0
+        self.skipped = 0
+
+    async def run(self, stop: Optional[asyncio.Event] = None, max_batches: Optional[int] = None):
+
+        uow = self.pubsub_unit_of_work
+        with uow:
+            batches = 0
+            next_pull = asyncio.ensure_future(self._pull())
+            acking = None
+            try:
+                while (stop is None or not stop.is_set()) and (max_batches is None or batches < max_batches):
+
+                    messages = await next_pull
+                    next_pull = asyncio.ensure_future(self._pull())
+                    if len(messages) == 0:
+                        await asyncio.sleep(self.empty_pull_sleep_seconds)
+                        continue
+
+                    batch = await self._process(messages)
+                    if acking is not None:
+                        await acking
+                    acking = asyncio.ensure_future(uow.commit_inbound(only=batch))
+                    batches += 1
+
+                if acking is not None:
+                    await acking
+                    acking = None
+            finally:
+                await self._release(next_pull)
+                if acking is not None:
+                    acking.cancel()
+                await uow.close_clients()
+
+    async def _pull(self) -> List[Any]:
+        repository = self.pubsub_unit_of_work.repository
+        messages = await repository._retriable_pull_call(self.subscription, self.pull_size)
+        return await repository._screen(self.subscription, messages)
+
+    async def _release(self, pull: asyncio.Future):
+        if not pull.done():
+            pull.cancel()
+            return
+        if pull.cancelled() or pull.exception() is not None:
+            return
+        ack_ids = [message.ack_id for message in pull.result()]
+        if len(ack_ids) > 0:
+            await self.pubsub_unit_of_work._retriable_modify_ack_deadline_call(self.subscription, ack_ids, 0)
+
+    async def _process(self, messages: List[Any]) -> List[Any]:
+
+        uow = self.pubsub_unit_of_work
+        message_ids = [getattr(message, "message_id", None) for message in messages]
+        known = [message_id for message_id in message_ids if message_id]
+
+        processed = await asyncio.to_thread(self._processed_ids, known)
+        fresh = [m for m, message_id in zip(messages, message_ids) if message_id not in processed]
+        duplicates = [m.ack_id for m, message_id in zip(messages, message_ids) if message_id in processed]
+        if len(duplicates) > 0:
+            await uow._retriable_acknowledge_call(self.subscription, duplicates)
+            self.skipped += len(duplicates)
+        if len(fresh) == 0:
+            return []
+
+        batch = uow.repository._messages_to_domain(self.subscription, self.MessageType, fresh, **self.context)
+        new_ids = list(dict.fromkeys(message_id for message_id in known if message_id not in processed))
+        try:
+            await asyncio.to_thread(self._write, batch, new_ids)
+        except Exception:
+            await uow.nack(only=batch)
+            raise
+
+        self.batches += 1
+        self.processed += len(fresh)
+        return batch
+
+    def _processed_ids(self, message_ids: List[str]) -> Set[str]:
+        if len(message_ids) == 0:
+            return set()
+        model = self.inbox_model
+        with self.db_unit_of_work as db:
+            return set(db.repository.session.execute(
+                select(model.message_id)
+                .where(model.subscription == self.subscription)
+                .where(model.message_id.in_(message_ids))
+            ).scalars())
+
+    def _write(self, batch: List[Any], message_ids: List[str]):
+        with self.db_unit_of_work as db:
+            self.handler(db.repository, batch)
+            self._record(db.repository.session, message_ids)
+            db.commit()
+
+    def _record(self, session: Session, message_ids: List[str]):
+        if len(message_ids) == 0:
+            return
+        processed_at = datetime.now(timezone.utc)
+        session.execute(
+            insert(self.inbox_model),
+            [
+                {"subscription": self.subscription, "message_id": message_id, "processed_at": processed_at}
+                for message_id in message_ids
+            ],
+        )
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "processed": self.processed, "skipped": self.skipped}
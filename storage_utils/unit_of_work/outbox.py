@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Type
+import asyncio
+import logging
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import DeclarativeBase
+
+from .db import SqlAlchemyUnitOfWork
+from .pubsub import PubSubEncoding, PubSubUnitOfWork
+from ..repository.outbox import OutboxRepository
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxUnitOfWork(PubSubEncoding, SqlAlchemyUnitOfWork):
+
+    repository: OutboxRepository
+
+    def __init__(self, session_factory: Callable, outbox_model: Type[DeclarativeBase]) -> None:
+
+        self.outbox_model = outbox_model
+        super().__init__(session_factory)
+
+    def create_repository(self) -> OutboxRepository:
+        self.snapshot = defaultdict(dict) if self.track_changes else None
+        self.outbox_buffer = []
+        return OutboxRepository(self.session_factory(), self.snapshot, self.outbox_buffer)
+
+    def commit(self):
+        if len(self.outbox_buffer) > 0:
+            self.repository.session.execute(insert(self.outbox_model), self._outbox_rows())
+            self.outbox_buffer.clear()
+        super().commit()
+
+    def _outbox_rows(self) -> List[Dict[str, Any]]:
+
+        created_at = datetime.now(timezone.utc)
+        rows = []
+        for topic, message in self.outbox_buffer:
+            codec = self.codecs.get(topic, self.default_codec)
+            rows.append({
+                "topic": topic,
+                "data": self._payload(codec, message),
+                "ordering_key": self._ordering_key(topic, message),
+                "attributes": self._attributes(topic, message, codec),
+                "created_at": created_at,
+            })
+        return rows
+
+    def rollback(self):
+        super().rollback()
+        self.outbox_buffer.clear()
+
+
+class OutboxRelay:
+
+    batch_size: int = 5000
+    poll_seconds: float = 1.0
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        outbox_model: Type[DeclarativeBase],
+        pubsub_unit_of_work: PubSubUnitOfWork,
+    ) -> None:
+
+        self.session_factory = session_factory
+        self.outbox_model = outbox_model
+        self.pubsub_unit_of_work = pubsub_unit_of_work
+        self.relayed = 0
+
+    async def relay_once(self) -> int:
+
+        model = self.outbox_model
+        session = self.session_factory()
+        try:
+            rows = session.execute(
+                select(model)
+                .where(model.sent_at.is_(None))
+                .order_by(model.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if len(rows) == 0:
+                session.rollback()
+                return 0
+
+            sent = await self._publish(rows)
+            if len(sent) > 0:
+                session.execute(
+                    update(model)
+                    .where(model.id.in_(sent))
+                    .values(sent_at=datetime.now(timezone.utc))
+                )
+            session.commit()
+            self.relayed += len(sent)
+            return len(sent)
+        finally:
+            session.close()
+
+    async def _publish(self, rows: List[Any]) -> List[int]:
+
+        from gcloud.aio.pubsub.utils import PubsubMessage
+
+        by_topic = {}
+        for row in rows:
+            by_topic.setdefault(row.topic, []).append(row)
+
+        uow = self.pubsub_unit_of_work
+        with uow:
+            semaphore = asyncio.Semaphore(uow.max_concurrent_requests)
+            lane_ids = []
+            lanes = []
+            for topic, topic_rows in by_topic.items():
+                row_ids = {}
+                encoded = []
+                for row in topic_rows:
+                    message = PubsubMessage(row.data, row.ordering_key, **row.attributes)
+                    row_ids[id(message)] = row.id
+                    encoded.append(message)
+                for batches in uow._publish_lanes(encoded):
+                    lane_ids.append([row_ids[id(m)] for batch in batches for m in batch])
+                    lanes.append(uow._publish_lane(topic, batches, semaphore))
+
+            results = await asyncio.gather(*lanes, return_exceptions=True)
+            await uow.close_clients()
+
+        sent = []
+        for ids, result in zip(lane_ids, results):
+            if isinstance(result, BaseException):
+                logger.warning("failed to relay %d outbox messages: %r", len(ids), result)
+            else:
+                sent.extend(ids)
+        return sent
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                relayed = await self.relay_once()
+            except Exception:
+                logger.exception("outbox relay failed")
+                relayed = 0
+            if relayed < self.batch_size:
+                try:
+                    await asyncio.wait_for(stop.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
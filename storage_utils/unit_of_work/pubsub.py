@@ -1,23 +1,172 @@
-from typing import List, Any, Type
-from collections import defaultdict
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List, Any, Optional, Tuple, Type
+from collections import defaultdict, deque
+import asyncio
+import logging
+import math
+import time
 
 from .abstract import UnitOfWork
+from ..codecs import Codec, JsonCodec, pack_envelope
+from ..dedup import RecentMessages
 from ..retrying import NoRetry, RetryingConfig
 from ..repository.pubsub import PubSubRepository
-from gcloud.aio.pubsub import SubscriberClient, PublisherClient
-from gcloud.aio.pubsub.utils import PubsubMessage
-from gcloud.aio.auth.token import Token
 
-TOKEN = Token(scopes=[
+if TYPE_CHECKING:
+    from gcloud.aio.auth.token import Token
+    from gcloud.aio.pubsub.utils import PubsubMessage
+
+SCOPES = [
     'https://www.googleapis.com/auth/pubsub',
-    ])
+    ]
+
+logger = logging.getLogger(__name__)
+
+_token = None
+
+
+def get_token() -> "Token":
+    global _token
+    if _token is None:
+        from gcloud.aio.auth.token import Token
+        _token = Token(scopes=SCOPES)
+    return _token
+
+
+def __getattr__(name: str):
+    if name == "TOKEN":
+        return get_token()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def subscriber_client(session=None):
+    from gcloud.aio.pubsub import SubscriberClient
+    return SubscriberClient(token=get_token(), session=session)
+
+
+def publisher_client(session=None):
+    from gcloud.aio.pubsub import PublisherClient
+    return PublisherClient(token=get_token(), session=session)
+
+
+class PubSubClientPool:
+
+    connection_limit: int = 100
+    connection_limit_per_host: int = 32
+    keepalive_timeout: float = 60
+
+    def __init__(self, subscriber_client_factory=None, publisher_client_factory=None) -> None:
+
+        if subscriber_client_factory is None:
+            subscriber_client_factory = subscriber_client
+        if publisher_client_factory is None:
+            publisher_client_factory = publisher_client
+
+        self.subscriber_client_factory = subscriber_client_factory
+        self.publisher_client_factory = publisher_client_factory
+        self._session = None
+        self._subscriber_client = None
+        self._publisher_client = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def subscriber_client(self):
+        if self._subscriber_client is None:
+            self._subscriber_client = self.subscriber_client_factory(self.session())
+        return self._subscriber_client
+
+    def publisher_client(self):
+        if self._publisher_client is None:
+            self._publisher_client = self.publisher_client_factory(self.session())
+        return self._publisher_client
+
+    async def close(self):
+        clients = [self._subscriber_client, self._publisher_client]
+        self._subscriber_client = None
+        self._publisher_client = None
+        for client in clients:
+            if client is not None:
+                await client.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class PubSubEncoding:
 
+    constant_ordering_key: str = 'key'
+    ordering_keys: Dict[str, Optional[Callable[[Any], str]]] = {}
+    default_codec: Type[Codec] = JsonCodec
+    codecs: Dict[str, Type[Codec]] = {}
+    publish_attributes: Dict[str, Callable[[Any], Dict[str, str]]] = {}
 
-class PubSubUnitOfWork(UnitOfWork):
+    def _ordering_key(self, topic: str, message: Any) -> str:
+        if topic not in self.ordering_keys:
+            return self.constant_ordering_key
+        ordering_key = self.ordering_keys[topic]
+        if ordering_key is None:
+            return ''
+        return ordering_key(message)
+
+    def _encode(self, topic: str, message: Any) -> "PubsubMessage":
+        from gcloud.aio.pubsub.utils import PubsubMessage
+        codec = self.codecs.get(topic, self.default_codec)
+        return PubsubMessage(
+            self._payload(codec, message),
+            self._ordering_key(topic, message),
+            **self._attributes(topic, message, codec),
+        )
+
+    def _payload(self, codec: Type[Codec], message: Any) -> bytes:
+        return codec.encode(message)
+
+    def _attributes(self, topic: str, message: Any, codec: Type[Codec]) -> Dict[str, str]:
+        attributes = {}
+        if topic in self.publish_attributes:
+            attributes.update(self.publish_attributes[topic](message))
+        if codec is not JsonCodec:
+            attributes["codec"] = codec.name
+        return attributes
+
+
+class PubSubUnitOfWork(PubSubEncoding, UnitOfWork):
 
     retrying_config: Type[RetryingConfig] = NoRetry
     timeout: int = 30
     batch_publish_messages: int = 1000
+    max_in_flight_pulls: int = 2
+    max_outstanding_messages: int = 10000
+    max_outstanding_bytes: int = 100 * 1024 * 1024
+    backpressure_poll_seconds: float = 0.05
+    max_ack_ids_per_request: int = 2500
+    max_concurrent_requests: int = 8
+    max_publish_bytes: int = 9 * 1000 * 1000
+    envelope_max_items: Dict[str, int] = {}
+    envelope_max_bytes: int = 1000 * 1000
+    attribute_filters: Dict[str, Callable[[Dict[str, str]], bool]] = {}
+    filtered_policy: str = "ack"
+    dead_letter_topics: Dict[str, str] = {}
+    max_buffered_messages: Optional[int] = None
+    max_buffered_bytes: Optional[int] = None
+    max_buffered_messages_per_topic: Optional[int] = None
+    max_buffered_bytes_per_topic: Optional[int] = None
+    buffer_full_policy: str = "flush"
+    nack_on_rollback: bool = False
+    dedup_max_entries: int = 0
+    dedup_window_seconds: Optional[float] = None
+    dedup_key: str = "message_id"
+    lease_management: bool = False
+    lease_interval_seconds: float = 5
+    min_ack_deadline: int = 10
+    max_ack_deadline: int = 600
     repository: PubSubRepository
 
     def __init__(
@@ -25,26 +174,98 @@ class PubSubUnitOfWork(UnitOfWork):
         pubsub_config: object,
         subscriber_client_factory=None,
         publisher_client_factory=None,
+        client_pool: Optional[PubSubClientPool] = None,
     ) -> None:
 
+        if self.buffer_full_policy not in ("flush", "block"):
+            raise ValueError(f"unknown buffer_full_policy {self.buffer_full_policy!r}, expected 'flush' or 'block'")
+
         self.pubsub_config = pubsub_config
-        self._constant_ordering_key = 'key'
+        self.client_pool = client_pool
 
+        if client_pool is not None:
+            subscriber_client_factory = client_pool.subscriber_client
+            publisher_client_factory = client_pool.publisher_client
         if subscriber_client_factory is None:
-            subscriber_client_factory = lambda : SubscriberClient(token=TOKEN)
+            subscriber_client_factory = subscriber_client
         if publisher_client_factory is None:
-            publisher_client_factory = lambda : PublisherClient(token=TOKEN)
+            publisher_client_factory = publisher_client
 
         self.subscriber_client_factory = subscriber_client_factory
         self.publisher_client_factory = publisher_client_factory
+        self.processing_times = deque(maxlen=1000)
+        self._lease_task = None
+        self._flush_task = None
+        self.rollback_nack = None
+        self.dedup = None
+        if self.dedup_max_entries > 0:
+            self.dedup = RecentMessages(
+                self.dedup_max_entries, self.dedup_window_seconds, self.dedup_key
+            )
 
         super().__init__()
 
     def create_repository_components(self):
         self.ack_buffer = defaultdict(dict)
         self.publisher_buffer = defaultdict(list)
+        self.dead_letter_buffer = defaultdict(list)
+        self._payloads = {}
+        self._buffered_sizes = defaultdict(list)
+        self._buffered_bytes = defaultdict(int)
+        self._publish_lock = asyncio.Lock()
         self.subscriber_client = self.subscriber_client_factory()
         self.publisher_client = self.publisher_client_factory()
+        self._leases = defaultdict(dict)
+        if self.lease_management:
+            self.start_lease_manager()
+
+    def start_lease_manager(self):
+        self.stop_lease_manager()
+        self._lease_task = asyncio.get_running_loop().create_task(self._maintain_leases())
+
+    def stop_lease_manager(self):
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+
+    def ack_deadline(self) -> int:
+        if len(self.processing_times) == 0:
+            return self.min_ack_deadline
+        ordered = sorted(self.processing_times)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        deadline = math.ceil(p99 + self.lease_interval_seconds)
+        return max(self.min_ack_deadline, min(self.max_ack_deadline, deadline))
+
+    async def _maintain_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_interval_seconds)
+            try:
+                await self.extend_leases()
+            except Exception:
+                logger.exception("failed to extend ack deadlines")
+
+    async def extend_leases(self):
+        now = time.monotonic()
+        deadline = self.ack_deadline()
+        for subscription, ack_ids in list(self.ack_buffer.items()):
+            if len(ack_ids) == 0:
+                continue
+            leases = self._leases[subscription]
+            to_extend = list(ack_ids.values())
+            for ack_id in to_extend:
+                leases.setdefault(ack_id, now)
+            for i in range(0, len(to_extend), self.max_ack_ids_per_request):
+                await self._retriable_modify_ack_deadline_call(
+                    subscription, to_extend[i : i + self.max_ack_ids_per_request], deadline
+                )
+
+    def _release_leases(self, subscription: str, ack_ids: List[str]):
+        leases = self._leases[subscription]
+        now = time.monotonic()
+        for ack_id in ack_ids:
+            leased_at = leases.pop(ack_id, None)
+            if leased_at is not None:
+                self.processing_times.append(now - leased_at)
 
     def create_repository(self) -> PubSubRepository:
         self.create_repository_components()
@@ -53,30 +274,310 @@ class PubSubUnitOfWork(UnitOfWork):
             self.pubsub_config,
             self.ack_buffer,
             self.publisher_buffer,
+            self.dedup,
+            self.attribute_filters,
+            self.filtered_policy,
+            self.dead_letter_topics,
+            self.dead_letter_buffer,
+            self._on_push if self._buffer_limited() else None,
+        )
+
+    async def stream(
+        self, subscription: str, MessageType: Any, **context
+    ) -> AsyncIterator[List[Any]]:
+
+        ack_ids = self.ack_buffer[subscription]
+        sizes = {}
+        reserved = {}
+
+        try:
+            while True:
+
+                for key in [key for key in sizes if key not in ack_ids]:
+                    del sizes[key]
+                average_size = sum(sizes.values()) / len(sizes) if len(sizes) > 0 else 0
+                outstanding_messages = len(ack_ids) + sum(n for n, _ in reserved.values())
+                outstanding_bytes = sum(sizes.values()) + sum(b for _, b in reserved.values())
+
+                while (
+                    len(reserved) < self.max_in_flight_pulls
+                    and outstanding_messages < self.max_outstanding_messages
+                    and outstanding_bytes < self.max_outstanding_bytes
+                ):
+                    max_messages = min(
+                        self.repository.max_pull_messages,
+                        self.max_outstanding_messages - outstanding_messages,
+                    )
+                    task = asyncio.ensure_future(
+                        self.repository._retriable_pull_call(subscription, max_messages)
+                    )
+                    reserved[task] = (max_messages, max_messages * average_size)
+                    outstanding_messages += max_messages
+                    outstanding_bytes += max_messages * average_size
+
+                if len(reserved) == 0:
+                    await asyncio.sleep(self.backpressure_poll_seconds)
+                    continue
+
+                done, _ = await asyncio.wait(list(reserved), return_when=asyncio.FIRST_COMPLETED)
+                received = False
+                for task in done:
+                    del reserved[task]
+                    messages = task.result()
+                    if len(messages) == 0:
+                        continue
+
+                    received = True
+                    batch = self.repository._messages_to_domain(
+                        subscription, MessageType, messages, **context
+                    )
+                    for domain_message, message in zip(batch, messages):
+                        sizes[id(domain_message)] = len(message.data)
+                    yield batch
+
+                if not received:
+                    await asyncio.sleep(self.backpressure_poll_seconds)
+        finally:
+            for task in reserved:
+                task.cancel()
+
+    def _buffer_limited(self) -> bool:
+        return any(
+            limit is not None
+            for limit in (
+                self.max_buffered_messages,
+                self.max_buffered_bytes,
+                self.max_buffered_messages_per_topic,
+                self.max_buffered_bytes_per_topic,
+            )
         )
 
+    def _buffer_tracks_bytes(self) -> bool:
+        return self.max_buffered_bytes is not None or self.max_buffered_bytes_per_topic is not None
+
+    def _on_push(self, topic: str, messages: List[Any]):
+
+        if self._buffer_tracks_bytes():
+            codec = self.codecs.get(topic, self.default_codec)
+            sizes = self._buffered_sizes[topic]
+            for message in messages:
+                payload = codec.encode(message)
+                self._payloads[id(message)] = payload
+                sizes.append(len(payload))
+                self._buffered_bytes[topic] += len(payload)
+
+        if self.buffer_full_policy == "flush" and self.buffer_full():
+            self._start_flush()
+
+    def buffer_full(self) -> bool:
+
+        total_messages = 0
+        total_bytes = 0
+        for topic, messages in self.publisher_buffer.items():
+            topic_bytes = self._buffered_bytes[topic]
+            if self.max_buffered_messages_per_topic is not None and len(messages) >= self.max_buffered_messages_per_topic:
+                return True
+            if self.max_buffered_bytes_per_topic is not None and topic_bytes >= self.max_buffered_bytes_per_topic:
+                return True
+            total_messages += len(messages)
+            total_bytes += topic_bytes
+
+        if self.max_buffered_messages is not None and total_messages >= self.max_buffered_messages:
+            return True
+        if self.max_buffered_bytes is not None and total_bytes >= self.max_buffered_bytes:
+            return True
+        return False
+
+    def _start_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.commit_outbound())
+
+    async def flow_control(self):
+        while self.buffer_full():
+            if self.buffer_full_policy == "block":
+                await self.commit_outbound()
+            else:
+                self._start_flush()
+                await asyncio.shield(self._flush_task)
+
     async def commit_outbound(self):
 
+        async with self._publish_lock:
+            await self._publish_buffer()
+
+    async def _publish_buffer(self):
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        taken = {}
+        topics = []
+        lanes = []
         for topic, messages in self.publisher_buffer.items():
             if len(messages) > 0:
-                for i in range(0, len(messages), self.batch_publish_messages):
-                    await self._retriable_publish_call(
-                        topic,
-                        [
-                            PubsubMessage(
-                                data=message.json().encode("utf-8"),
-                                ordering_key=self._constant_ordering_key
-                                )
-                            for message in messages[i : i + self.batch_publish_messages]
-                        ],
-                    )
-                messages[:] = []
+                taken[topic] = len(messages)
+                encoded = self._encode_topic(topic, messages[: taken[topic]])
+                for batches in self._publish_lanes(encoded):
+                    topics.append(topic)
+                    lanes.append(self._publish_lane(topic, batches, semaphore))
+
+        results = await asyncio.gather(*lanes, return_exceptions=True)
+
+        failed = set(topic for topic, result in zip(topics, results) if isinstance(result, BaseException))
+        for topic in set(taken) - failed:
+            self._drop_published(topic, taken[topic])
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _drop_published(self, topic: str, count: int):
+        messages = self.publisher_buffer[topic]
+        if len(self._payloads) > 0:
+            for message in messages[:count]:
+                self._payloads.pop(id(message), None)
+        del messages[:count]
+        sizes = self._buffered_sizes[topic]
+        self._buffered_bytes[topic] -= sum(sizes[:count])
+        del sizes[:count]
+
+    def _encode_topic(self, topic: str, messages: List[Any]) -> List["PubsubMessage"]:
+
+        if topic not in self.envelope_max_items:
+            return [self._encode(topic, message) for message in messages]
+
+        from gcloud.aio.pubsub.utils import PubsubMessage
+
+        codec = self.codecs.get(topic, self.default_codec)
+        max_items = self.envelope_max_items[topic]
+
+        groups = defaultdict(list)
+        for message in messages:
+            attributes = tuple(sorted(self._attributes(topic, message, codec).items()))
+            groups[(self._ordering_key(topic, message), attributes)].append(self._payload(codec, message))
+
+        encoded = []
+        for (ordering_key, attributes), payloads in groups.items():
+            attributes = {**dict(attributes), "envelope": "1"}
+            envelope = []
+            size = 0
+            for payload in payloads:
+                if len(envelope) > 0 and (
+                    len(envelope) >= max_items
+                    or size + len(payload) + 4 > self.envelope_max_bytes
+                ):
+                    encoded.append(PubsubMessage(pack_envelope(envelope), ordering_key, **attributes))
+                    envelope = []
+                    size = 0
+                envelope.append(payload)
+                size += len(payload) + 4
+            encoded.append(PubsubMessage(pack_envelope(envelope), ordering_key, **attributes))
+        return encoded
+
+    def _payload(self, codec: Type[Codec], message: Any) -> bytes:
+        payload = self._payloads.get(id(message))
+        if payload is None:
+            payload = codec.encode(message)
+        return payload
+
+    @staticmethod
+    def _publish_size(message: "PubsubMessage") -> int:
+        size = 4 * math.ceil(len(message.data) / 3) + len(message.ordering_key) + 32
+        for key, value in message.attributes.items():
+            size += len(key) + len(value) + 8
+        return size
+
+    def _publish_lanes(self, messages: List["PubsubMessage"]) -> List[List[List["PubsubMessage"]]]:
+
+        by_key = defaultdict(list)
+        for message in messages:
+            by_key[message.ordering_key].append(message)
+
+        lanes = []
+        for ordering_key, keyed in by_key.items():
+            batches = []
+            batch = []
+            batch_size = 0
+            for message in keyed:
+                size = self._publish_size(message)
+                if len(batch) > 0 and (
+                    len(batch) >= self.batch_publish_messages
+                    or batch_size + size > self.max_publish_bytes
+                ):
+                    batches.append(batch)
+                    batch = []
+                    batch_size = 0
+                batch.append(message)
+                batch_size += size
+            batches.append(batch)
+
+            if ordering_key:
+                lanes.append(batches)
+            else:
+                lanes.extend([batch] for batch in batches)
+        return lanes
+
+    async def _publish_lane(self, topic: str, batches: List[List["PubsubMessage"]], semaphore: asyncio.Semaphore):
+        for batch in batches:
+            async with semaphore:
+                await self._retriable_publish_call(topic, batch)
 
     async def commit_inbound(self, 
                              only: List[Any] | None = None, 
                              excluding: List[Any] | None = None):
+
+        await self.commit_dead_letters()
+        calls = [
+            self._acknowledge_chunk(topic, ack_ids, chunk)
+            for topic, ack_ids, chunk in self._select_chunks(only, excluding)
+        ]
+        await self._gather_bounded(calls)
+
+    async def commit_dead_letters(self):
+
+        from gcloud.aio.pubsub.utils import PubsubMessage
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        pending = []
+        lanes = []
+        for subscription, dead_letters in self.dead_letter_buffer.items():
+            ack_ids = self.ack_buffer[subscription]
+            dead_letters[:] = [x for x in dead_letters if id(x) in ack_ids]
+            if len(dead_letters) > 0:
+                pending.extend(dead_letters)
+                encoded = [PubsubMessage(x.data, '', **x.attributes) for x in dead_letters]
+                for batches in self._publish_lanes(encoded):
+                    lanes.append(self._publish_lane(self.dead_letter_topics[subscription], batches, semaphore))
+
+        if len(pending) == 0:
+            return
+
+        results = await asyncio.gather(*lanes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        calls = [
+            self._acknowledge_chunk(topic, ack_ids, chunk)
+            for topic, ack_ids, chunk in self._select_chunks(pending)
+        ]
+        await self._gather_bounded(calls)
+        for dead_letters in self.dead_letter_buffer.values():
+            dead_letters[:] = []
+
+    async def nack(self,
+                   only: List[Any] | None = None,
+                   excluding: List[Any] | None = None):
+
+        calls = [
+            self._nack_chunk(topic, ack_ids, chunk)
+            for topic, ack_ids, chunk in self._select_chunks(only, excluding, nack=True)
+        ]
+        await self._gather_bounded(calls)
+
+    def _select_chunks(self,
+                       only: List[Any] | None = None,
+                       excluding: List[Any] | None = None,
+                       nack: bool = False):
         if only is not None:
-            only_ids = set(id(x) for x in only)
+            only_ids = list(dict.fromkeys(id(x) for x in only))
         elif excluding is not None:
             excluding_ids = set(id(x) for x in excluding)
 
@@ -84,18 +585,81 @@ class PubSubUnitOfWork(UnitOfWork):
             if len(ack_ids) > 0:
 
                 if only is not None:
-                    ack_ids_filtered = [ack_id for x, ack_id in ack_ids.items() if x in only_ids]
+                    keys = [x for x in only_ids if x in ack_ids]
                 elif excluding is not None:
-                    ack_ids_filtered = [ack_id for x, ack_id in ack_ids.items() if x not in excluding_ids]
+                    keys = [x for x in ack_ids if x not in excluding_ids]
                 else:
-                    ack_ids_filtered = list(ack_ids.values())
+                    keys = list(ack_ids)
 
-                await self._retriable_acknowledge_call(
-                    topic, ack_ids_filtered
-                )
-                ack_ids.clear() 
+                units = self._group_by_ack_id(ack_ids, keys, nack)
+                for i in range(0, len(units), self.max_ack_ids_per_request):
+                    yield topic, ack_ids, units[i : i + self.max_ack_ids_per_request]
+
+    @staticmethod
+    def _group_by_ack_id(ack_ids: Dict[int, str], keys: List[int], nack: bool):
+
+        selected = defaultdict(list)
+        for x in keys:
+            selected[ack_ids[x]].append(x)
+        if len(selected) == len(keys) == len(ack_ids):
+            return list(selected.items())
+
+        members = defaultdict(list)
+        for x, ack_id in ack_ids.items():
+            members[ack_id].append(x)
+
+        units = []
+        for ack_id, selected_keys in selected.items():
+            if nack:
+                units.append((ack_id, members[ack_id]))
+            elif len(selected_keys) == len(members[ack_id]):
+                units.append((ack_id, selected_keys))
+            else:
+                for x in selected_keys:
+                    del ack_ids[x]
+        return units
+
+    async def _acknowledge_chunk(self, topic: str, ack_ids: Dict[int, str], units: List[Tuple[str, List[int]]]):
+        chunk = [ack_id for ack_id, _ in units]
+        await self._retriable_acknowledge_call(topic, chunk)
+        for _, keys in units:
+            for x in keys:
+                del ack_ids[x]
+        self._release_leases(topic, chunk)
+
+    async def _nack_chunk(self, topic: str, ack_ids: Dict[int, str], units: List[Tuple[str, List[int]]]):
+        chunk = [ack_id for ack_id, _ in units]
+        await self._retriable_modify_ack_deadline_call(topic, chunk, 0)
+        for _, keys in units:
+            for x in keys:
+                ack_ids.pop(x, None)
+        for ack_id in chunk:
+            self._leases[topic].pop(ack_id, None)
+
+    async def _nack_buffer(self, ack_buffer: Dict[str, Dict[int, str]]):
+        calls = []
+        for topic, ack_ids in ack_buffer.items():
+            units = self._group_by_ack_id(ack_ids, list(ack_ids), nack=True)
+            for i in range(0, len(units), self.max_ack_ids_per_request):
+                calls.append(self._nack_chunk(topic, ack_ids, units[i : i + self.max_ack_ids_per_request]))
+        await self._gather_bounded(calls)
+
+    async def _gather_bounded(self, calls: List[Awaitable]) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def _bounded(call):
+            async with semaphore:
+                return await call
+
+        results = await asyncio.gather(*[_bounded(call) for call in calls], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
 
     async def close_clients(self):
+        if self.client_pool is not None:
+            return
         await self.publisher_client.close()
         await self.subscriber_client.close()
 
@@ -103,18 +667,37 @@ class PubSubUnitOfWork(UnitOfWork):
 
         await self.commit_outbound()
         await self.commit_inbound()
+        self.stop_lease_manager()
         
         await self.close_clients()
 
 
     def rollback(self):
+        self.stop_lease_manager()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self.nack_on_rollback and any(len(ack_ids) > 0 for ack_ids in self.ack_buffer.values()):
+            to_nack = defaultdict(dict)
+            for topic, ack_ids in self.ack_buffer.items():
+                to_nack[topic].update(ack_ids)
+            self.rollback_nack = asyncio.get_running_loop().create_task(
+                self._nack_buffer(to_nack)
+            )
+
         for _, ack_ids in self.ack_buffer.items():
             ack_ids.clear()
 
         for _, messages in self.publisher_buffer.items():
             messages[:] = []
+        self._payloads.clear()
+        self._buffered_sizes.clear()
+        self._buffered_bytes.clear()
+
+        for _, dead_letters in self.dead_letter_buffer.items():
+            dead_letters[:] = []
 
-    async def _retriable_publish_call(self, topic: str, messages: List[PubsubMessage]):
+    async def _retriable_publish_call(self, topic: str, messages: List["PubsubMessage"]):
         return await self.retrying_config.to_decorator()(self.publisher_client.publish)(
                                 topic,
                                 messages,
@@ -126,3 +709,7 @@ class PubSubUnitOfWork(UnitOfWork):
             topic, ack_ids, timeout=self.timeout
         )
 
+    async def _retriable_modify_ack_deadline_call(self, topic: str, ack_ids: List[str], ack_deadline_seconds: int):
+        return await self.retrying_config.to_decorator()(self.subscriber_client.modify_ack_deadline)(
+            topic, ack_ids, ack_deadline_seconds, timeout=self.timeout
+        )
@@ -0,0 +1,171 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerContext:
+
+    stop_poll_seconds: float = 0.1
+
+    def __init__(self, worker_id: int, stop_event, processed, heartbeat) -> None:
+        self.worker_id = worker_id
+        self.stop = asyncio.Event()
+        self._stop_event = stop_event
+        self._processed = processed
+        self._heartbeat = heartbeat
+
+    def report(self, processed: int):
+        with self._processed.get_lock():
+            self._processed.value += processed
+        self.beat()
+
+    def beat(self):
+        self._heartbeat.value = time.time()
+
+    async def _watch_stop(self):
+        while not self._stop_event.is_set():
+            self.beat()
+            await asyncio.sleep(self.stop_poll_seconds)
+        self.stop.set()
+
+
+def _run_worker(worker: Callable[[WorkerContext], Awaitable[Any]], worker_id: int, stop_event, processed, heartbeat):
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    async def main():
+        context = WorkerContext(worker_id, stop_event, processed, heartbeat)
+        watcher = asyncio.ensure_future(context._watch_stop())
+        try:
+            await worker(context)
+        finally:
+            watcher.cancel()
+
+    asyncio.run(main())
+
+
+class WorkerState:
+
+    def __init__(self, worker_id: int, ctx) -> None:
+        self.worker_id = worker_id
+        self.processed = ctx.Value("q", 0)
+        self.heartbeat = ctx.Value("d", time.time())
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.next_start = 0.0
+
+
+class ConsumerSupervisor:
+
+    processes: Optional[int] = None
+    start_method: str = "spawn"
+    check_interval_seconds: float = 1.0
+    restart_backoff_seconds: float = 1.0
+    max_restart_backoff_seconds: float = 60.0
+    health_timeout_seconds: float = 60.0
+    shutdown_timeout_seconds: float = 30.0
+
+    def __init__(self, worker: Callable[[WorkerContext], Awaitable[Any]]) -> None:
+
+        self.worker = worker
+        self._ctx = multiprocessing.get_context(self.start_method)
+        self._stop_event = self._ctx.Event()
+        count = self.processes if self.processes is not None else multiprocessing.cpu_count()
+        self.workers = [WorkerState(i, self._ctx) for i in range(count)]
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for state in self.workers:
+            self._spawn(state)
+
+    def _spawn(self, state: WorkerState):
+        state.heartbeat.value = time.time()
+        state.process = self._ctx.Process(
+            target=_run_worker,
+            args=(self.worker, state.worker_id, self._stop_event, state.processed, state.heartbeat),
+            name=f"consumer-{state.worker_id}",
+            daemon=True,
+        )
+        state.process.start()
+        state.started_at = time.monotonic()
+
+    def check(self):
+
+        if self._stop_event.is_set():
+            return
+
+        now = time.monotonic()
+        for state in self.workers:
+            process = state.process
+            if process is not None and process.is_alive():
+                if time.time() - state.heartbeat.value <= self.health_timeout_seconds:
+                    continue
+                logger.warning("consumer %d missed heartbeats, restarting", state.worker_id)
+                process.terminate()
+                process.join(self.shutdown_timeout_seconds)
+
+            if state.process is not None:
+                logger.warning(
+                    "consumer %d exited with code %s", state.worker_id, state.process.exitcode
+                )
+                state.process = None
+                state.restarts += 1
+                backoff = self.restart_backoff_seconds * 2 ** min(state.restarts - 1, 16)
+                state.next_start = now + min(backoff, self.max_restart_backoff_seconds)
+
+            if now >= state.next_start:
+                self._spawn(state)
+
+    def stop(self):
+
+        self._stop_event.set()
+        deadline = time.monotonic() + self.shutdown_timeout_seconds
+        for state in self.workers:
+            if state.process is not None:
+                state.process.join(max(deadline - time.monotonic(), 0))
+        for state in self.workers:
+            if state.process is not None and state.process.is_alive():
+                logger.warning("consumer %d did not stop in time, terminating", state.worker_id)
+                state.process.terminate()
+                state.process.join()
+
+    def stats(self) -> List[Dict[str, Any]]:
+
+        now = time.monotonic()
+        output = []
+        for state in self.workers:
+            alive = state.process is not None and state.process.is_alive()
+            elapsed = now - self.started_at if self.started_at is not None else 0
+            output.append({
+                "worker": state.worker_id,
+                "pid": state.process.pid if state.process is not None else None,
+                "alive": alive,
+                "processed": state.processed.value,
+                "throughput": state.processed.value / elapsed if elapsed > 0 else 0.0,
+                "restarts": state.restarts,
+                "heartbeat_age": time.time() - state.heartbeat.value,
+            })
+        return output
+
+    def run(self):
+
+        stopping = []
+        previous = signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        self.start()
+        try:
+            while len(stopping) == 0:
+                time.sleep(self.check_interval_seconds)
+                self.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            signal.signal(signal.SIGTERM, previous)
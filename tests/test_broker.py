@@ -0,0 +1,127 @@
+import time
+
+import aiohttp
+import pytest
+from gcloud.aio.pubsub.utils import PubsubMessage
+
+from storage_utils.testing.broker import InMemoryBroker
+from storage_utils.testing.fixtures import *
+from storage_utils.unit_of_work.pubsub import PubSubClientPool, PubSubUnitOfWork
+
+
+class Clock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_roundtrip(fake_data):
+
+    broker = InMemoryBroker()
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = PubSubUnitOfWork({}, broker.subscriber_client, broker.publisher_client)
+
+    with uow:
+        uow.repository._push_to_topic("ticks", MessageTick, ticks)
+        await uow.commit()
+
+    with uow:
+        pulled = await uow.repository._pull_from_subscription("ticks", MessageTick)
+        assert pulled == ticks
+        assert broker.outstanding("ticks") == len(ticks)
+        await uow.commit()
+
+    assert broker.backlog("ticks") == 0
+    assert broker.outstanding("ticks") == 0
+    assert broker.stats["acked"] == len(ticks)
+
+    pool = PubSubClientPool(broker.subscriber_client, broker.publisher_client)
+    with PubSubUnitOfWork({}, client_pool=pool) as pooled:
+        assert await pooled.repository._pull_from_subscription("ticks", MessageTick) == []
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_lease_expiry_and_nack_redeliver():
+
+    clock = Clock()
+    broker = InMemoryBroker(clock)
+    client = broker.subscriber_client()
+    await broker.publish("t", [PubsubMessage(b"a"), PubsubMessage(b"b")])
+
+    [first, second] = await client.pull("t", 10)
+    await client.modify_ack_deadline("t", [second.ack_id], 60)
+    clock.now = 11
+
+    [expired] = await client.pull("t", 10)
+    assert expired.message_id == first.message_id
+    assert expired.delivery_attempt == 2
+    assert expired.ack_id != first.ack_id
+
+    await client.acknowledge("t", [first.ack_id, second.ack_id])
+    await client.modify_ack_deadline("t", [expired.ack_id], 0)
+    [nacked] = await client.pull("t", 10)
+    assert nacked.data == b"a" and nacked.delivery_attempt == 3
+    assert broker.stats["redelivered"] == 2
+    assert broker.stats["acked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ordering_keys():
+
+    broker = InMemoryBroker()
+    client = broker.subscriber_client()
+    await broker.publish("t", [PubsubMessage(x, "k") for x in (b"1", b"2", b"3")])
+    await broker.publish("t", [PubsubMessage(b"other", "j")])
+
+    first = await client.pull("t", 1)
+    assert [m.data for m in first] == [b"1"]
+    assert [m.data for m in await client.pull("t", 10)] == [b"other"]
+
+    await client.acknowledge("t", [first[0].ack_id])
+    second = await client.pull("t", 10)
+    assert [m.data for m in second] == [b"2", b"3"]
+
+    await client.modify_ack_deadline("t", [second[0].ack_id], 0)
+    assert [m.data for m in await client.pull("t", 10)] == [b"2", b"3"]
+
+
+@pytest.mark.asyncio
+async def test_fault_injection_and_fan_out():
+
+    class FlakyBroker(InMemoryBroker):
+        fault_rates = {"pull": 1.0}
+        auto_subscribe = False
+
+    broker = FlakyBroker()
+    broker.subscribe("t", "a")
+    broker.subscribe("t", "b")
+    await broker.publish("t", [PubsubMessage(b"x")])
+    assert broker.backlog("a") == broker.backlog("b") == 1
+
+    with pytest.raises(aiohttp.ClientOSError):
+        await broker.subscriber_client().pull("a", 10)
+    assert broker.stats["pull_faults"] == 1
+
+
+@pytest.mark.asyncio
+async def test_throughput():
+
+    broker = InMemoryBroker()
+    client = broker.subscriber_client()
+    messages = [PubsubMessage(b"x", str(i % 100)) for i in range(50000)]
+
+    started = time.perf_counter()
+    await broker.publish("t", messages)
+    received = 0
+    while received < len(messages):
+        batch = await client.pull("t", 1000)
+        await client.acknowledge("t", [m.ack_id for m in batch])
+        received += len(batch)
+
+    assert time.perf_counter() - started < 5
+    assert broker.backlog("t") == 0
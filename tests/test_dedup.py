@@ -0,0 +1,32 @@
+import pytest
+from storage_utils.dedup import RecentMessages
+from storage_utils.testing.fixtures import to_fake_message
+
+
+def test_lru_eviction():
+
+    dedup = RecentMessages(max_entries=2)
+    messages = [to_fake_message("{}", i) for i in range(3)]
+    for i, message in enumerate(messages):
+        message.message_id = str(i)
+
+    assert [dedup.seen("s", m) for m in messages] == [False, False, False]
+    assert dedup.seen("s", messages[0]) is False
+    assert dedup.seen("s", messages[2]) is True
+    assert dedup.seen("other", messages[2]) is False
+
+
+def test_payload_key_and_window(monkeypatch):
+
+    now = [0.0]
+    monkeypatch.setattr("storage_utils.dedup.time.monotonic", lambda: now[0])
+    dedup = RecentMessages(window_seconds=10, key="payload")
+
+    assert dedup.seen("s", to_fake_message('{"a": 1}', 0)) is False
+    assert dedup.seen("s", to_fake_message('{"a": 1}', 1)) is True
+    now[0] = 11
+    assert dedup.seen("s", to_fake_message('{"a": 1}', 2)) is False
+    assert dedup.stats() == {"hits": 1, "misses": 2, "size": 1}
+
+    with pytest.raises(ValueError):
+        RecentMessages(key="ordering_key")
@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+
+IMPORT_BUDGET_SECONDS = 2.0
+
+
+def import_in_subprocess(module: str) -> dict:
+    code = f"""
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)
+
+
+def loaded(modules, prefix: str) -> bool:
+    return any(m == prefix or m.startswith(prefix + ".") for m in modules)
+
+
+def test_db_side_does_not_import_pubsub_or_dialects():
+
+    result = import_in_subprocess("storage_utils.unit_of_work.db")
+
+    assert not loaded(result["modules"], "gcloud")
+    assert not loaded(result["modules"], "aiohttp")
+    assert not loaded(result["modules"], "sqlalchemy.dialects.postgresql")
+    assert not loaded(result["modules"], "sqlalchemy.dialects.sqlite")
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS
+
+
+def test_pubsub_side_defers_client_libraries():
+
+    result = import_in_subprocess("storage_utils.unit_of_work.pubsub")
+
+    assert not loaded(result["modules"], "gcloud")
+    assert not loaded(result["modules"], "aiohttp")
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS
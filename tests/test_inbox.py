@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy.sql import func, select
+
+from storage_utils.testing.fixtures import *
+from storage_utils.unit_of_work.db import SqlAlchemyUnitOfWork
+from storage_utils.unit_of_work.inbox import InboxPipeline
+from storage_utils.unit_of_work.pubsub import PubSubUnitOfWork
+
+
+@pytest.fixture
+def consuming_subscriber_client(fake_pubsub_subscriber_client, fake_pubsub_subscriber_buffer):
+
+    class ConsumingSubscriberClient(fake_pubsub_subscriber_client):
+        async def pull(self, subscription, max_messages=20, timeout=10):
+            messages = await super().pull(subscription, max_messages, timeout)
+            fake_pubsub_subscriber_buffer[subscription] = fake_pubsub_subscriber_buffer[subscription][len(messages):]
+            return messages
+
+    return ConsumingSubscriberClient
+
+
+class SmallPullPipeline(InboxPipeline):
+    pull_size = 4
+    empty_pull_sleep_seconds = 0.01
+
+
+def count(session_factory, model):
+    with session_factory() as session:
+        return session.execute(select(func.count()).select_from(model)).scalar()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_redeliveries(
+    sqlite_session_factory,
+    consuming_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+):
+
+    written = []
+
+    def handler(repository, batch):
+        written.append(len(batch))
+        repository._upsert_type(DataTick, batch)
+
+    pubsub_uow = PubSubUnitOfWork({}, consuming_subscriber_client, fake_pubsub_publisher_client)
+    pipeline = SmallPullPipeline(
+        pubsub_uow, SqlAlchemyUnitOfWork(sqlite_session_factory), InboxMessage, "test", MessageTick, handler
+    )
+
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+    await pipeline.run(max_batches=3)
+
+    assert written == [4, 4, 2]
+    assert count(sqlite_session_factory, DataTick) == 10
+    assert count(sqlite_session_factory, InboxMessage) == 10
+    assert sorted(pubsub_uow.subscriber_client.acknowledged["test"], key=int) == [m.ack_id for m in fake_messages]
+
+    FakeMessage = type(fake_messages[0])
+    redelivered = []
+    for message in fake_messages[:3]:
+        copy = FakeMessage("redelivered-" + message.ack_id, message.data)
+        copy.message_id = message.message_id
+        redelivered.append(copy)
+    fake_pubsub_subscriber_buffer["test"] = redelivered
+    await pipeline.run(max_batches=1)
+
+    assert written == [4, 4, 2]
+    assert pubsub_uow.subscriber_client.acknowledged["test"][-3:] == [m.ack_id for m in redelivered]
+    assert pipeline.stats() == {"batches": 3, "processed": 10, "skipped": 3}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_nacks_failed_batches(
+    sqlite_session_factory,
+    consuming_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+):
+
+    def handler(repository, batch):
+        repository._upsert_type(DataTick, batch)
+        raise RuntimeError("constraint violated")
+
+    pubsub_uow = PubSubUnitOfWork({}, consuming_subscriber_client, fake_pubsub_publisher_client)
+    pipeline = SmallPullPipeline(
+        pubsub_uow, SqlAlchemyUnitOfWork(sqlite_session_factory), InboxMessage, "test", MessageTick, handler
+    )
+
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+    with pytest.raises(RuntimeError):
+        await pipeline.run(max_batches=3)
+
+    assert count(sqlite_session_factory, DataTick) == 0
+    assert count(sqlite_session_factory, InboxMessage) == 0
+    assert pubsub_uow.subscriber_client.acknowledged["test"] == []
+    nacked = [ack_id for ack_id, deadline in pubsub_uow.subscriber_client.modified_ack_deadlines["test"] if deadline == 0]
+    assert sorted(nacked, key=int) == [m.ack_id for m in fake_messages[:8]]
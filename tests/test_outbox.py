@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from sqlalchemy.sql import func, select
+
+from storage_utils.testing.fixtures import *
+from storage_utils.unit_of_work.outbox import OutboxRelay, OutboxUnitOfWork
+from storage_utils.unit_of_work.pubsub import PubSubUnitOfWork
+
+
+def test_outbox_written_with_data(sqlite_session_factory, fake_data):
+
+    class TickOutboxUnitOfWork(OutboxUnitOfWork):
+        publish_attributes = {"ticks": lambda m: {"ticker": m.ticker}}
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = TickOutboxUnitOfWork(sqlite_session_factory, OutboxMessage)
+
+    with uow:
+        uow.repository._push_type(DataTick, ticks[:5])
+        uow.repository._push_to_topic("ticks", MessageTick, ticks[:5])
+
+    with uow:
+        uow.repository._push_type(DataTick, ticks)
+        uow.repository._push_to_topic("ticks", MessageTick, ticks)
+        uow.commit()
+
+    with uow:
+        session = uow.repository.session
+        assert session.execute(select(func.count()).select_from(DataTick)).scalar() == len(ticks)
+        rows = session.execute(select(OutboxMessage).order_by(OutboxMessage.id)).scalars().all()
+
+    assert [MessageTick.parse_raw(r.data.decode()).to_domain() for r in rows] == ticks
+    assert all(r.ordering_key == "key" and r.attributes == {"ticker": "SPY"} for r in rows)
+    assert all(r.sent_at is None for r in rows)
+
+
+@pytest.mark.asyncio
+async def test_relay(
+    sqlite_session_factory,
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    class FailingPublisherClient(fake_pubsub_publisher_client):
+        async def publish(self, topic, messages, timeout=10):
+            if topic == "broken":
+                raise RuntimeError("unavailable")
+            await super().publish(topic, messages, timeout)
+
+    class SmallBatchRelay(OutboxRelay):
+        batch_size = 8
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = OutboxUnitOfWork(sqlite_session_factory, OutboxMessage)
+    with uow:
+        uow.repository._push_to_topic("ticks", MessageTick, ticks)
+        uow.repository._push_to_topic("broken", MessageTick, ticks[:2])
+        uow.commit()
+
+    relay = SmallBatchRelay(
+        sqlite_session_factory,
+        OutboxMessage,
+        PubSubUnitOfWork({}, fake_pubsub_subscriber_client, FailingPublisherClient),
+    )
+    assert await relay.relay_once() == 8
+    assert await relay.relay_once() == 2
+    assert await relay.relay_once() == 0
+    assert relay.relayed == 10
+
+    published = [MessageTick.parse_raw(m.data.decode()).to_domain() for m in fake_pubsub_publisher_buffer["ticks"]]
+    assert published == ticks
+
+    with uow:
+        unsent = uow.repository.session.execute(
+            select(OutboxMessage.topic).where(OutboxMessage.sent_at.is_(None))
+        ).scalars().all()
+    assert unsent == ["broken", "broken"]
+
+    stop = asyncio.Event()
+    running = asyncio.ensure_future(relay.run(stop))
+    await asyncio.sleep(0.01)
+    stop.set()
+    await asyncio.wait_for(running, 1)
@@ -0,0 +1,39 @@
+from sqlalchemy.sql import text
+
+from storage_utils.testing.fixtures import *
+from storage_utils.profiles import SqliteIngestProfile
+from storage_utils.unit_of_work.db import SqlAlchemyUnitOfWork
+
+
+def test_sqlite_ingest_profile(on_disk_sqlite_db, fake_data):
+
+    class FrequentCheckpointProfile(SqliteIngestProfile):
+        checkpoint_every_commits = 2
+
+    engine = FrequentCheckpointProfile.apply(on_disk_sqlite_db)
+    engine = FrequentCheckpointProfile.apply(engine)
+
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    uow = SqlAlchemyUnitOfWork(sessionmaker(bind=engine))
+    for x in fake_data:
+        with uow:
+            uow.repository._push_type(DataTick, [DomainTick.from_dict(x)])
+            uow.commit()
+
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        count = conn.execute(text("SELECT COUNT(*) FROM ticks")).scalar()
+
+    assert journal_mode == "wal"
+    assert synchronous == 1
+    assert count == len(fake_data)
+    assert statements.count("BEGIN IMMEDIATE") == len(fake_data) + 1
+    assert FrequentCheckpointProfile.stats(engine)["checkpoints"] == len(fake_data) // 2
+
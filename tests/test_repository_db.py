@@ -240,3 +240,105 @@ def test_upsert_type_if_not_exists_relationship(
     for c, c_domain in zip(cs_, sum([x["cs"] for x in domain_a1["bs"]], [])):
         assert c.id == c_domain["id"]
         assert c.value == c_domain["value"]
+
+def test_push_latest(sqlite_session_factory, fake_data):
+
+    class LatestTicksRepository(SqlAlchemyRepository):
+        latest_tables = {DataTick: LatestTick}
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    other = DomainTick.from_dict({**fake_data[0], "ticker": "QQQ"})
+
+    with sqlite_session_factory() as session:
+        repository = LatestTicksRepository(session)
+        repository._push_type(DataTick, ticks[3:6] + [other])
+        repository._upsert_type(DataTick, ticks[:3])
+        repository._push_type_if_not_exist(DataTick, ticks[6:])
+        session.commit()
+
+    with sqlite_session_factory() as session:
+        repository = LatestTicksRepository(session)
+        latest = repository._pull_latest(DataTick)
+
+    assert sorted(latest, key=lambda x: x.ticker) == [other, ticks[-1]]
+
+def test_export_query(sqlite_session_factory, fake_data, tmp_path):
+
+    class SmallChunksRepository(SqlAlchemyRepository):
+        export_chunk_size = 3
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+
+    with sqlite_session_factory() as session:
+        repository = SmallChunksRepository(session)
+        repository._push_type(DataTick, ticks)
+        session.commit()
+
+    path = tmp_path / "ticks.csv"
+    with sqlite_session_factory() as session:
+        repository = SmallChunksRepository(session)
+        stats = repository._export_query(select(DataTick).order_by(DataTick.t), str(path))
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    assert stats.rows == len(ticks)
+    assert stats.bytes == path.stat().st_size
+    assert lines[0] == "ticker,t,close,volume"
+    assert len(lines) == len(ticks) + 1
+
+def test_push_latest_corrections(sqlite_session_factory, fake_data):
+
+    class LatestTicksRepository(SqlAlchemyRepository):
+        latest_tables = {DataTick: LatestTick}
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data[:2]]
+
+    with sqlite_session_factory() as session:
+        repository = LatestTicksRepository(session)
+        repository._push_type(DataTick, ticks)
+
+        ticks[1].close = 99.0
+        ticks[1].volume = 99.0
+        repository._upsert_type(DataTick, [ticks[1]], ["close"])
+
+        ignored = DomainTick.from_dict({**fake_data[1], "close": 1.0})
+        repository._push_type_if_not_exist(DataTick, [ignored])
+        session.commit()
+
+    with sqlite_session_factory() as session:
+        repository = LatestTicksRepository(session)
+        [latest] = repository._pull_latest(DataTick)
+        [data] = session.execute(select(DataTick).where(DataTick.t == ticks[1].t)).scalars()
+
+    assert (latest.close, latest.volume) == (99.0, fake_data[1]["volume"])
+    assert latest == data.to_domain()
+
+def test_export_query_parquet(sqlite_session_factory, fake_data, tmp_path):
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    class SingleRowChunksRepository(SqlAlchemyRepository):
+        export_chunk_size = 1
+
+    with sqlite_session_factory() as session:
+        repository = SingleRowChunksRepository(session)
+        repository._push_type(A, [{"id": "0", "value": None, "bs": []}, {"id": "1", "value": "foo", "bs": []}])
+        session.commit()
+
+    path = tmp_path / "a.parquet"
+    empty_path = tmp_path / "empty.parquet"
+    with sqlite_session_factory() as session:
+        repository = SingleRowChunksRepository(session)
+        stats = repository._export_query(select(A).order_by(A.id), str(path), "parquet")
+        empty_stats = repository._export_query(select(A).where(A.id == "2"), str(empty_path), "parquet")
+
+        assert session.connection().get_execution_options() == {}
+
+        with pytest.raises(ValueError):
+            repository._export_query(select(A), str(tmp_path / "a.xlsx"), "xlsx")
+
+    assert stats.rows == 2
+    assert pq.read_table(path).to_pylist() == [{"id": "0", "value": None}, {"id": "1", "value": "foo"}]
+    assert empty_stats.rows == 0
+    assert pq.read_table(empty_path).schema.names == ["id", "value"]
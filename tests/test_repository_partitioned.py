@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from sqlalchemy.sql import text
+
+from storage_utils.testing.fixtures import *
+from storage_utils.repository.partitioned import (
+    DailyPartitioning,
+    MonthlyPartitioning,
+    PartitionedSqlAlchemyRepository,
+)
+
+
+@pytest.fixture
+def partitioned_repository():
+
+    class DailyTicksRepository(PartitionedSqlAlchemyRepository):
+        partitioning = {DataTick: DailyPartitioning}
+        create_partitions = True
+
+    return DailyTicksRepository
+
+
+def test_partitioning_keys():
+
+    assert DailyPartitioning.keys_between(
+        datetime(2023, 1, 30, 10), datetime(2023, 2, 1, 9)
+    ) == ["20230130", "20230131", "20230201"]
+    assert MonthlyPartitioning.keys_between(
+        datetime(2022, 11, 30), datetime(2023, 2, 1)
+    ) == ["202211", "202212", "202301", "202302"]
+
+
+def test_push_and_pull_partitions(sqlite_session_factory, partitioned_repository, fake_data):
+
+    ticks = []
+    for i, x in enumerate(fake_data):
+        tick = DomainTick.from_dict(x)
+        tick.t = tick.t + timedelta(days=i % 3)
+        ticks.append(tick)
+
+    with sqlite_session_factory() as session:
+        repository = partitioned_repository(session)
+        repository._push_type(DataTick, ticks)
+        repository._upsert_type(DataTick, ticks[:2])
+        session.commit()
+
+    with sqlite_session_factory() as session:
+        counts = {
+            day: session.execute(text(f"SELECT COUNT(*) FROM ticks_{day}")).scalar()
+            for day in ["20230101", "20230102", "20230103"]
+        }
+        [unrouted] = session.execute(text("SELECT COUNT(*) FROM ticks")).scalars()
+
+    assert counts == {"20230101": 4, "20230102": 3, "20230103": 3}
+    assert unrouted == 0
+
+    with sqlite_session_factory() as session:
+        repository = partitioned_repository(session)
+        pulled = repository._pull_partitions(
+            DataTick, datetime(2023, 1, 2), datetime(2023, 1, 5)
+        )
+
+    expected = sorted([x for x in ticks if x.t >= datetime(2023, 1, 2)], key=lambda x: x.t)
+    assert pulled == expected
+
+
+def test_pull_does_not_create_partitions(sqlite_session_factory, partitioned_repository):
+
+    with sqlite_session_factory() as session:
+        repository = partitioned_repository(session)
+        pulled = repository._pull_partitions(
+            DataTick, datetime(2023, 1, 1), datetime(2023, 3, 1)
+        )
+        tables = session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'ticks_%'")
+        ).scalars().all()
+
+    assert pulled == []
+    assert tables == []
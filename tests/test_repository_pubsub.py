@@ -1,9 +1,19 @@
+import asyncio
 import pytest
 from collections import defaultdict
 from storage_utils.testing.fixtures import *
 from storage_utils.repository.pubsub import PubSubRepository
 
 
+@pytest.fixture
+def fake_exception():
+
+    class FakeException(Exception):
+        pass
+
+    return FakeException
+
+
 @pytest.mark.asyncio
 async def test_pull(
     fake_pubsub_subscriber_client,
@@ -35,3 +45,120 @@ async def test_push(fake_pubsub_subscriber_client, fake_data):
     repository._push_to_topic("test", MessageTick, domain_ticks)
 
     assert publish_buffer["test"] == message_ticks
+
+
+@pytest.mark.asyncio
+async def test_pull_from_subscriptions(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_data,
+):
+
+    class ConsumingSubscriberClient(fake_pubsub_subscriber_client):
+        async def pull(self, subscription, max_messages=20, timeout=10):
+            messages = await super().pull(subscription, max_messages, timeout)
+            fake_pubsub_subscriber_buffer[subscription] = fake_pubsub_subscriber_buffer[subscription][len(messages):]
+            return messages
+
+    class SmallPullsRepository(PubSubRepository):
+        max_pull_messages = 2
+
+    fake_pubsub_subscriber_buffer["a"] = fake_messages
+    fake_pubsub_subscriber_buffer["b"] = fake_messages[:3]
+    ack_buffer = defaultdict(dict)
+    repository = SmallPullsRepository(
+        ConsumingSubscriberClient(), {}, ack_buffer, defaultdict(list)
+    )
+
+    messages = await repository._pull_from_subscriptions(
+        {"a": MessageTick, "b": MessageTick}, max_messages=100
+    )
+    domain_ticks = [DomainTick.from_dict(x) for x in fake_data]
+
+    assert messages["a"] == domain_ticks
+    assert messages["b"] == domain_ticks[:3]
+    assert len(ack_buffer["a"]) == len(fake_messages)
+
+    fake_pubsub_subscriber_buffer["a"] = fake_messages
+    messages = await repository._pull_from_subscriptions(
+        {"a": MessageTick, "b": MessageTick}, max_messages=3
+    )
+
+    assert messages["a"] == domain_ticks[:3]
+    assert messages["b"] == []
+
+
+@pytest.mark.asyncio
+async def test_pull_from_subscriptions_slow_and_failing(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_exception,
+):
+
+    class UnevenSubscriberClient(fake_pubsub_subscriber_client):
+        async def pull(self, subscription, max_messages=20, timeout=10):
+            if subscription == "slow":
+                await asyncio.sleep(10)
+            if subscription == "failing":
+                raise fake_exception()
+            return await super().pull(subscription, max_messages, timeout)
+
+    fake_pubsub_subscriber_buffer["good"] = fake_messages
+    ack_buffer = defaultdict(dict)
+    repository = PubSubRepository(
+        UnevenSubscriberClient(), {}, ack_buffer, defaultdict(list)
+    )
+
+    messages = await asyncio.wait_for(
+        repository._pull_from_subscriptions(
+            {"good": MessageTick, "slow": MessageTick}, max_seconds=0.1
+        ),
+        1,
+    )
+    assert len(messages["good"]) == len(fake_messages)
+    assert messages["slow"] == []
+
+    ack_buffer.clear()
+    with pytest.raises(fake_exception):
+        await repository._pull_from_subscriptions(
+            {"good": MessageTick, "failing": MessageTick}
+        )
+    assert len(ack_buffer["good"]) == len(fake_messages)
+
+
+@pytest.mark.asyncio
+async def test_pull_parse_bytes_and_many(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_data,
+):
+
+    calls = []
+
+    class BytesMessageTick(MessageTick):
+        @classmethod
+        def parse_bytes(cls, raw):
+            calls.append(type(raw))
+            return cls.parse_raw(raw)
+
+    class BatchMessageTick(MessageTick):
+        @classmethod
+        def parse_many(cls, raws):
+            calls.append(len(raws))
+            return [cls.parse_raw(raw) for raw in raws]
+
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+    repository = PubSubRepository(
+        fake_pubsub_subscriber_client(), {}, defaultdict(dict), defaultdict(list)
+    )
+    domain_ticks = [DomainTick.from_dict(x) for x in fake_data]
+
+    assert await repository._pull_from_subscription("test", BytesMessageTick) == domain_ticks
+    assert calls == [bytes] * len(fake_messages)
+
+    calls.clear()
+    assert await repository._pull_from_subscription("test", BatchMessageTick) == domain_ticks
+    assert calls == [len(fake_messages)]
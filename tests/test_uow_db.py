@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
+from sqlalchemy.sql import select, text
 
 from storage_utils.testing.fixtures import *
 from storage_utils.unit_of_work.db import SqlAlchemyUnitOfWork
@@ -55,3 +55,60 @@ def test_rollback(sqlite_session_factory, fake_data):
         data_ticks = get_all_ticks(uow.repository.session)
 
     assert len(data_ticks) == 0
+
+
+def test_track_changes(sqlite_session_factory, fake_data):
+
+    class TrackingUnitOfWork(SqlAlchemyUnitOfWork):
+        track_changes = True
+
+    uow = TrackingUnitOfWork(sqlite_session_factory)
+    ticks = [DomainTick.from_dict(x) for x in fake_data[:2]]
+
+    with uow:
+        uow.repository._push_type(DataTick, ticks)
+        uow.commit()
+
+    with uow:
+        pulled = uow.repository._pull_scalars_query(select(DataTick).order_by(DataTick.t))
+        uow.repository.session.execute(text("UPDATE ticks SET close = 99.0"))
+
+        pulled[0].volume += 100
+        uow.repository._upsert_type(DataTick, pulled)
+        uow.commit()
+
+    with uow:
+        [data0, data1] = uow.repository.session.execute(
+            select(DataTick).order_by(DataTick.t)
+        ).scalars()
+
+    assert data0.volume == ticks[0].volume + 100
+    assert data0.close == 99.0
+    assert data1.close == 99.0
+
+
+def test_track_changes_per_row_columns(sqlite_session_factory, fake_data):
+
+    class TrackingUnitOfWork(SqlAlchemyUnitOfWork):
+        track_changes = True
+
+    uow = TrackingUnitOfWork(sqlite_session_factory)
+    ticks = [DomainTick.from_dict(x) for x in fake_data[:3]]
+
+    with uow:
+        uow.repository._push_type(DataTick, ticks)
+        uow.repository.session.execute(text("UPDATE ticks SET volume = 77.0, close = 55.0"))
+
+        ticks[0].close += 1
+        ticks[1].volume += 1
+        uow.repository._upsert_type(DataTick, ticks)
+        uow.commit()
+
+    with uow:
+        [data0, data1, data2] = uow.repository.session.execute(
+            select(DataTick).order_by(DataTick.t)
+        ).scalars()
+
+    assert (data0.close, data0.volume) == (ticks[0].close, 77.0)
+    assert (data1.close, data1.volume) == (55.0, ticks[1].volume)
+    assert (data2.close, data2.volume) == (55.0, 77.0)
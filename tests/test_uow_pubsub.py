@@ -1,7 +1,10 @@
+import asyncio
 import json
 
 from storage_utils.testing.fixtures import *
-from storage_utils.unit_of_work.pubsub import PubSubUnitOfWork
+from gcloud.aio.pubsub.utils import PubsubMessage
+from storage_utils.codecs import GzipCompression, OrjsonCodec, compressed, get_codec
+from storage_utils.unit_of_work.pubsub import PubSubClientPool, PubSubUnitOfWork
 
 
 @pytest.mark.asyncio
@@ -131,3 +134,553 @@ async def test_commit(
     ]
     assert published_ticks == message_ticks
 
+
+
+@pytest.mark.asyncio
+async def test_stream_backpressure(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_data,
+):
+
+    class TwoAtATimeSubscriberClient(fake_pubsub_subscriber_client):
+        async def pull(self, subscription, max_messages=20, timeout=10):
+            messages = await super().pull(subscription, 2, timeout)
+            fake_pubsub_subscriber_buffer[subscription] = fake_pubsub_subscriber_buffer[subscription][len(messages):]
+            return messages
+
+    class BoundedPubSubUnitOfWork(PubSubUnitOfWork):
+        max_outstanding_messages = 4
+        backpressure_poll_seconds = 0.01
+
+    uow = BoundedPubSubUnitOfWork(
+        {}, TwoAtATimeSubscriberClient, fake_pubsub_publisher_client
+    )
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+
+    with uow:
+        stream = uow.stream("test", MessageTick)
+        received = []
+        while len(received) < uow.max_outstanding_messages:
+            received += await asyncio.wait_for(stream.__anext__(), 1)
+
+        blocked = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.1)
+        assert not blocked.done()
+
+        await uow.commit_inbound()
+        received += await asyncio.wait_for(blocked, 1)
+        while len(received) < len(fake_messages):
+            await uow.commit_inbound()
+            received += await asyncio.wait_for(stream.__anext__(), 1)
+        await stream.aclose()
+
+    assert received == [DomainTick.from_dict(x) for x in fake_data]
+
+
+@pytest.mark.asyncio
+async def test_lease_management(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+):
+
+    class LeasingPubSubUnitOfWork(PubSubUnitOfWork):
+        lease_management = True
+        lease_interval_seconds = 0.01
+        max_ack_ids_per_request = 3
+
+    uow = LeasingPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+
+    with uow:
+        await uow.repository._pull_from_subscription("test", MessageTick)
+        await asyncio.sleep(0.05)
+        lease_task = uow._lease_task
+        await uow.commit()
+
+        modified = uow.subscriber_client.modified_ack_deadlines["test"]
+        assert set(ack_id for ack_id, _ in modified) == set(m.ack_id for m in fake_messages)
+        assert all(deadline == uow.min_ack_deadline for _, deadline in modified)
+
+    await asyncio.sleep(0)
+    assert lease_task.cancelled()
+    assert uow._lease_task is None
+    assert len(uow.processing_times) == len(fake_messages)
+
+    uow.processing_times.extend([30.0] * 100)
+    assert uow.ack_deadline() == 31
+    uow.processing_times.extend([5000.0] * 100)
+    assert uow.ack_deadline() == uow.max_ack_deadline
+
+
+@pytest.mark.asyncio
+async def test_ack_chunks_keep_unacked(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+):
+
+    requests = []
+
+    class RecordingSubscriberClient(fake_pubsub_subscriber_client):
+        async def acknowledge(self, subscription, ack_ids, timeout=10):
+            requests.append((subscription, list(ack_ids)))
+            await super().acknowledge(subscription, ack_ids, timeout)
+
+    class ChunkedPubSubUnitOfWork(PubSubUnitOfWork):
+        max_ack_ids_per_request = 3
+        max_concurrent_requests = 2
+
+    uow = ChunkedPubSubUnitOfWork(
+        {}, RecordingSubscriberClient, fake_pubsub_publisher_client
+    )
+    fake_pubsub_subscriber_buffer["a"] = fake_messages
+    fake_pubsub_subscriber_buffer["b"] = fake_messages
+
+    with uow:
+        ticks_a = await uow.repository._pull_from_subscription("a", MessageTick)
+        ticks_b = await uow.repository._pull_from_subscription("b", MessageTick)
+        await uow.commit_inbound(only=ticks_a[:5] + ticks_b[:1])
+
+        assert sorted(len(ack_ids) for _, ack_ids in requests) == [1, 2, 3]
+        assert set(uow.ack_buffer["a"]) == set(id(x) for x in ticks_a[5:])
+        assert set(uow.ack_buffer["b"]) == set(id(x) for x in ticks_b[1:])
+
+        await uow.commit_inbound()
+        assert len(uow.ack_buffer["a"]) == len(uow.ack_buffer["b"]) == 0
+
+    assert set(uow.subscriber_client.acknowledged["a"]) == set(m.ack_id for m in fake_messages)
+
+
+@pytest.mark.asyncio
+async def test_nack(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+):
+
+    class NackingPubSubUnitOfWork(PubSubUnitOfWork):
+        nack_on_rollback = True
+        max_ack_ids_per_request = 4
+
+    uow = NackingPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    fake_pubsub_subscriber_buffer["test"] = fake_messages
+
+    with uow:
+        ticks = await uow.repository._pull_from_subscription("test", MessageTick)
+        await uow.nack(excluding=ticks[:3])
+        nacked = list(uow.subscriber_client.modified_ack_deadlines["test"])
+        assert set(uow.ack_buffer["test"]) == set(id(x) for x in ticks[:3])
+
+    await uow.rollback_nack
+    rolled_back = uow.subscriber_client.modified_ack_deadlines["test"][len(nacked):]
+
+    assert nacked == [(m.ack_id, 0) for m in fake_messages[3:]]
+    assert rolled_back == [(m.ack_id, 0) for m in fake_messages[:3]]
+    assert uow.subscriber_client.acknowledged["test"] == []
+
+
+@pytest.mark.asyncio
+async def test_publish_batches_by_bytes_concurrently(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    requests = []
+    in_flight = {"now": 0, "max": 0}
+
+    class SlowPublisherClient(fake_pubsub_publisher_client):
+        async def publish(self, topic, messages, timeout=10):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            requests.append((topic, len(messages)))
+            await super().publish(topic, messages, timeout)
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    message_size = PubSubUnitOfWork._publish_size(
+        PubsubMessage(MessageTick.from_domain(ticks[0]).json().encode("utf-8"), "key")
+    )
+
+    class SmallBatchesPubSubUnitOfWork(PubSubUnitOfWork):
+        max_publish_bytes = 3 * message_size
+        max_concurrent_requests = 4
+
+    uow = SmallBatchesPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, SlowPublisherClient
+    )
+
+    with uow:
+        uow.repository._push_to_topic("a", MessageTick, ticks)
+        uow.repository._push_to_topic("b", MessageTick, ticks)
+        await uow.commit_outbound()
+        assert uow.publisher_buffer["a"] == uow.publisher_buffer["b"] == []
+
+    assert sorted(n for topic, n in requests if topic == "a") == [1, 3, 3, 3]
+    assert in_flight["max"] == 2
+    for topic in ["a", "b"]:
+        published = [MessageTick.parse_raw(x.data.decode("utf8")) for x in fake_pubsub_publisher_buffer[topic]]
+        assert published == [MessageTick.from_domain(x) for x in ticks]
+
+
+@pytest.mark.asyncio
+async def test_publish_ordering_keys(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    class KeyedPubSubUnitOfWork(PubSubUnitOfWork):
+        batch_publish_messages = 2
+        ordering_keys = {"by_ticker": lambda message: message.ticker, "unordered": None}
+
+    ticks = [DomainTick.from_dict({**x, "ticker": ["SPY", "QQQ"][i % 2]}) for i, x in enumerate(fake_data)]
+    uow = KeyedPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+
+    with uow:
+        for topic in ["by_ticker", "unordered", "default"]:
+            uow.repository._push_to_topic(topic, MessageTick, ticks)
+        await uow.commit_outbound()
+
+    by_ticker = fake_pubsub_publisher_buffer["by_ticker"]
+    for ticker in ["SPY", "QQQ"]:
+        published = [MessageTick.parse_raw(x.data.decode("utf8")) for x in by_ticker if x.ordering_key == ticker]
+        assert published == [MessageTick.from_domain(x) for x in ticks if x.ticker == ticker]
+    assert set(x.ordering_key for x in fake_pubsub_publisher_buffer["unordered"]) == {""}
+    assert set(x.ordering_key for x in fake_pubsub_publisher_buffer["default"]) == {"key"}
+
+
+@pytest.mark.asyncio
+async def test_codecs_roundtrip(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_pubsub_subscriber_buffer,
+    fake_data,
+):
+
+    orjson_gzip = compressed(OrjsonCodec, GzipCompression)
+
+    class CodecPubSubUnitOfWork(PubSubUnitOfWork):
+        codecs = {"compressed": orjson_gzip}
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = CodecPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+
+    with uow:
+        uow.repository._push_to_topic("compressed", MessageTick, ticks)
+        uow.repository._push_to_topic("plain", MessageTick, ticks)
+        await uow.commit_outbound()
+
+    for topic in ["compressed", "plain"]:
+        for i, message in enumerate(fake_pubsub_publisher_buffer[topic]):
+            message.ack_id = str(i)
+        fake_pubsub_subscriber_buffer[topic] = fake_pubsub_publisher_buffer[topic]
+
+    assert fake_pubsub_publisher_buffer["compressed"][0].attributes == {"codec": "orjson+gzip"}
+    assert fake_pubsub_publisher_buffer["plain"][0].attributes == {}
+    assert get_codec("orjson+gzip") is orjson_gzip
+
+    with uow:
+        compressed_ticks = await uow.repository._pull_from_subscription("compressed", MessageTick)
+        plain_ticks = await uow.repository._pull_from_subscription("plain", MessageTick)
+
+    assert compressed_ticks == plain_ticks == ticks
+
+
+@pytest.mark.asyncio
+async def test_envelopes(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_pubsub_subscriber_buffer,
+    fake_data,
+):
+
+    class EnvelopePubSubUnitOfWork(PubSubUnitOfWork):
+        envelope_max_items = {"packed": 3}
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data][:5]
+    uow = EnvelopePubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+
+    with uow:
+        uow.repository._push_to_topic("packed", MessageTick, ticks)
+        await uow.commit_outbound()
+
+    published = fake_pubsub_publisher_buffer["packed"]
+    assert len(published) == 2
+    assert all(message.attributes == {"envelope": "1"} for message in published)
+    for i, message in enumerate(published):
+        message.ack_id = str(i)
+    fake_pubsub_subscriber_buffer["packed"] = list(published)
+
+    with uow:
+        pulled = await uow.repository._pull_from_subscription("packed", MessageTick)
+        assert pulled == ticks
+
+        await uow.commit_inbound(only=pulled[:2])
+        assert uow.subscriber_client.acknowledged["packed"] == []
+        assert len(uow.ack_buffer["packed"]) == 3
+
+        await uow.commit_inbound(only=pulled[2:4])
+        assert uow.subscriber_client.acknowledged["packed"] == ["0"]
+
+        await uow.nack()
+        assert uow.subscriber_client.modified_ack_deadlines["packed"] == [("1", 0)]
+        assert len(uow.ack_buffer["packed"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_dedup_redeliveries(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_data,
+):
+
+    class DedupPubSubUnitOfWork(PubSubUnitOfWork):
+        dedup_max_entries = 1000
+
+    uow = DedupPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    first = fake_messages[:10]
+    redelivered = []
+    for i, message in enumerate(fake_messages[:5]):
+        copy = type(message)(f"redelivered-{i}", message.data)
+        copy.message_id = message.message_id
+        redelivered.append(copy)
+
+    fake_pubsub_subscriber_buffer["test"] = first + redelivered
+    with uow:
+        ticks = await uow.repository._pull_from_subscription("test", MessageTick)
+        assert ticks == [DomainTick.from_dict(x) for x in fake_data[:10]]
+        assert uow.subscriber_client.acknowledged["test"] == [m.ack_id for m in redelivered]
+        assert len(uow.ack_buffer["test"]) == 10
+        await uow.commit_inbound()
+
+    fake_pubsub_subscriber_buffer["test"] = list(redelivered)
+    with uow:
+        assert await uow.repository._pull_from_subscription("test", MessageTick) == []
+
+    assert uow.dedup.stats() == {"hits": 10, "misses": 10, "size": 10}
+
+
+@pytest.mark.asyncio
+async def test_attribute_filters(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_pubsub_subscriber_buffer,
+    fake_data,
+):
+
+    class FilteringPubSubUnitOfWork(PubSubUnitOfWork):
+        publish_attributes = {"mixed": lambda m: {"kind": "tick" if m.t.minute % 2 == 0 else "noise"}}
+        attribute_filters = {"mixed": lambda attributes: attributes.get("kind") == "tick"}
+
+    class NackingPubSubUnitOfWork(FilteringPubSubUnitOfWork):
+        filtered_policy = "nack"
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = FilteringPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    with uow:
+        uow.repository._push_to_topic("mixed", MessageTick, ticks)
+        await uow.commit_outbound()
+
+    published = list(fake_pubsub_publisher_buffer["mixed"])
+    for i, message in enumerate(published):
+        message.ack_id = str(i)
+    noise = [m.ack_id for m in published if m.attributes["kind"] == "noise"]
+    assert 0 < len(noise) < len(published)
+
+    fake_pubsub_subscriber_buffer["mixed"] = list(published)
+    with uow:
+        pulled = await uow.repository._pull_from_subscription("mixed", MessageTick)
+        assert pulled == [x for x in ticks if x.t.minute % 2 == 0]
+        assert uow.subscriber_client.acknowledged["mixed"] == noise
+
+    uow = NackingPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    fake_pubsub_subscriber_buffer["mixed"] = list(published)
+    with uow:
+        await uow.repository._pull_from_subscription("mixed", MessageTick)
+        assert uow.subscriber_client.modified_ack_deadlines["mixed"] == [(x, 0) for x in noise]
+
+
+@pytest.mark.asyncio
+async def test_dead_letters(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_pubsub_subscriber_buffer,
+    fake_messages,
+    fake_data,
+):
+
+    class DeadLetterPubSubUnitOfWork(PubSubUnitOfWork):
+        dead_letter_topics = {"test": "test-dead-letters"}
+
+    FakeMessage = type(fake_messages[0])
+    poison = [FakeMessage("poison-0", b"not json"), FakeMessage("poison-1", b'{"t": "2023-01-01 10:10:20"}')]
+    fake_pubsub_subscriber_buffer["test"] = fake_messages[:3] + poison + fake_messages[3:]
+
+    uow = DeadLetterPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+    with uow:
+        ticks = await uow.repository._pull_from_subscription("test", MessageTick)
+        assert ticks == [DomainTick.from_dict(x) for x in fake_data]
+        assert uow.subscriber_client.acknowledged["test"] == []
+
+        await uow.commit_inbound(only=ticks[:2])
+        dead_letters = fake_pubsub_publisher_buffer["test-dead-letters"]
+        assert [x.data for x in dead_letters] == [b"not json", b'{"t": "2023-01-01 10:10:20"}']
+        assert dead_letters[0].attributes["dead_letter_subscription"] == "test"
+        assert dead_letters[1].attributes["dead_letter_error"].startswith("KeyError")
+        assert uow.subscriber_client.acknowledged["test"] == ["poison-0", "poison-1", "0", "1"]
+
+    fake_pubsub_subscriber_buffer["test-without-dead-letters"] = poison
+    with uow:
+        with pytest.raises(Exception):
+            await uow.repository._pull_from_subscription("test-without-dead-letters", MessageTick)
+
+
+@pytest.mark.asyncio
+async def test_client_pool(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    closed = []
+
+    class ClosingPublisherClient(fake_pubsub_publisher_client):
+        async def close(self):
+            closed.append(self)
+
+    sessions = []
+    pool = PubSubClientPool(
+        lambda session: sessions.append(session) or fake_pubsub_subscriber_client(),
+        lambda session: sessions.append(session) or ClosingPublisherClient(),
+    )
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+
+    clients = []
+    for _ in range(3):
+        uow = PubSubUnitOfWork({}, client_pool=pool)
+        with uow:
+            uow.repository._push_to_topic("test", MessageTick, ticks)
+            await uow.commit()
+            clients.append((uow.subscriber_client, uow.publisher_client))
+
+    assert len(set(clients)) == 1
+    assert len(fake_pubsub_publisher_buffer["test"]) == 3 * len(ticks)
+    assert sessions[0] is sessions[1]
+    assert sessions[0].connector.limit_per_host == PubSubClientPool.connection_limit_per_host
+    assert closed == []
+
+    await pool.close()
+    assert closed == [clients[0][1]]
+    assert sessions[0].closed
+
+
+@pytest.mark.asyncio
+async def test_bounded_publisher_buffer_flushes_in_background(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    release = asyncio.Event()
+
+    class GatedPublisherClient(fake_pubsub_publisher_client):
+        async def publish(self, topic, messages, timeout=10):
+            await release.wait()
+            await super().publish(topic, messages, timeout)
+
+    class BoundedPubSubUnitOfWork(PubSubUnitOfWork):
+        max_buffered_messages_per_topic = 4
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    uow = BoundedPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, GatedPublisherClient
+    )
+
+    with uow:
+        uow.repository._push_to_topic("test", MessageTick, ticks[:4])
+        assert uow.buffer_full()
+        uow.repository._push_to_topic("test", MessageTick, ticks[4:6])
+
+        blocked = asyncio.ensure_future(uow.flow_control())
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        release.set()
+        await asyncio.wait_for(blocked, 1)
+        assert not uow.buffer_full()
+        published = [MessageTick.parse_raw(m.data.decode()).to_domain() for m in fake_pubsub_publisher_buffer["test"]]
+        assert published == ticks[:6]
+
+        uow.repository._push_to_topic("test", MessageTick, ticks[6:])
+        await uow.commit()
+
+    published = [MessageTick.parse_raw(m.data.decode()).to_domain() for m in fake_pubsub_publisher_buffer["test"]]
+    assert published == ticks
+
+
+@pytest.mark.asyncio
+async def test_bounded_publisher_buffer_blocks_on_bytes(
+    fake_pubsub_subscriber_client,
+    fake_pubsub_publisher_client,
+    fake_pubsub_publisher_buffer,
+    fake_data,
+):
+
+    ticks = [DomainTick.from_dict(x) for x in fake_data]
+    size = len(MessageTick.from_domain(ticks[0]).json())
+
+    class BlockingPubSubUnitOfWork(PubSubUnitOfWork):
+        max_buffered_bytes = 3 * size
+        buffer_full_policy = "block"
+
+    uow = BlockingPubSubUnitOfWork(
+        {}, fake_pubsub_subscriber_client, fake_pubsub_publisher_client
+    )
+
+    with uow:
+        for tick in ticks:
+            uow.repository._push_to_topic("a" if tick.t.minute % 2 else "b", MessageTick, [tick])
+            assert uow._flush_task is None
+            await uow.flow_control()
+            assert sum(len(m) for m in uow.publisher_buffer.values()) < 3
+        await uow.commit()
+
+    assert len(fake_pubsub_publisher_buffer["a"]) + len(fake_pubsub_publisher_buffer["b"]) == len(ticks)
+    assert len(uow._payloads) == 0
@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import os
+import time
+
+from storage_utils.workers import ConsumerSupervisor
+
+
+async def counting_worker(context):
+    while not context.stop.is_set():
+        context.report(1)
+        await asyncio.sleep(0.01)
+
+
+async def crash_once_worker(marker_dir, context):
+    marker = os.path.join(marker_dir, f"crashed-{context.worker_id}")
+    if context.worker_id == 0 and not os.path.exists(marker):
+        open(marker, "w").close()
+        raise RuntimeError("poison")
+    await counting_worker(context)
+
+
+def wait_until(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+class TwoWorkerSupervisor(ConsumerSupervisor):
+    processes = 2
+    restart_backoff_seconds = 0.01
+    shutdown_timeout_seconds = 10
+
+
+def test_workers_report_and_stop():
+
+    supervisor = TwoWorkerSupervisor(counting_worker)
+    supervisor.start()
+    try:
+        wait_until(lambda: all(s["processed"] > 0 for s in supervisor.stats()))
+    finally:
+        supervisor.stop()
+
+    stats = supervisor.stats()
+    assert [s["worker"] for s in stats] == [0, 1]
+    assert all(not s["alive"] and s["restarts"] == 0 for s in stats)
+    assert all(w.process.exitcode == 0 for w in supervisor.workers)
+
+
+def test_crashed_worker_restarts(tmp_path):
+
+    supervisor = TwoWorkerSupervisor(functools.partial(crash_once_worker, str(tmp_path)))
+    supervisor.start()
+    try:
+        wait_until(lambda: not supervisor.workers[0].process.is_alive())
+        wait_until(lambda: supervisor.check() or supervisor.workers[0].process is not None)
+        wait_until(lambda: supervisor.stats()[0]["processed"] > 0)
+    finally:
+        supervisor.stop()
+
+    assert [s["restarts"] for s in supervisor.stats()] == [1, 0]